@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from glucose_io import GlucoseSeries, load_glucose_csv, time_range, day_dates
+from glucose_store import patient_name
+
+# 患者ごとのアーカイブの保存先（環境変数で変更可能）
+ARCHIVE_DIR_NAME = '.glucose_archive'
+ARCHIVE_VERSION = 1
+
+# 1 件の測定値 = 時刻（1970-01-01 からの秒, int64）+ グルコース値（float32）の固定長の列
+#   <患者>/time-<世代>.i64, <患者>/glucose-<世代>.f32 : 時刻順の列（末尾への追記のみ。過去の測定値を取り込むときは新しい世代に書き直す）
+#   <患者>/index.json : 件数・世代・日ごとの開始行（日番号 first_day + k の最初の行が day_rows[k]）
+# index.json の件数までが有効な行で、index.json の置き換えが書き込みの確定になる
+# （追記の途中で止まっても、次の追記の前に件数より後ろは切り捨てる）
+_INDEX = 'index.json'
+
+
+def default_archive_dir():
+    return os.environ.get('GLUCOSE_ARCHIVE_DIR') or ARCHIVE_DIR_NAME
+
+
+def archive_path(patient, archive_dir=None):
+    return os.path.join(archive_dir or default_archive_dir(), patient)
+
+
+def _column_files(path, generation):
+    return os.path.join(path, f'time-{generation}.i64'), os.path.join(path, f'glucose-{generation}.f32')
+
+
+def _map(file, dtype, count):
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode='r', shape=(count,))
+
+
+# 日ごとの開始行（日の境界の時刻を二分探索するだけなので、列全体は読まない）
+def _day_rows(seconds):
+    if len(seconds) == 0:
+        return 0, []
+    first_day, last_day = int(seconds[0]) // 86400, int(seconds[-1]) // 86400
+    bounds = np.arange(first_day, last_day + 2, dtype=np.int64) * 86400
+    return first_day, np.searchsorted(seconds, bounds, side='left').tolist()
+
+
+# 1人の患者のアーカイブ（読み込み専用のメモリマップ）
+# series() はコピーせずメモリマップの一部を GlucoseSeries として返すので、CSV の解析も配列のコピーも起きない
+class GlucoseArchive:
+    def __init__(self, path):
+        self.path = path
+        index_file = os.path.join(path, _INDEX)
+        if os.path.exists(index_file):
+            with open(index_file, encoding='utf-8') as fp:
+                index = json.load(fp)
+            if index.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f"Unsupported archive version in {path}: {index.get('version')}")
+        else:
+            index = {'version': ARCHIVE_VERSION, 'count': 0, 'generation': 0, 'first_day': 0, 'day_rows': []}
+        self.index = index
+        time_file, glucose_file = _column_files(path, index['generation'])
+        self.seconds = _map(time_file, np.int64, index['count'])
+        self.glucose = _map(glucose_file, np.float32, index['count'])
+
+    def __len__(self):
+        return self.index['count']
+
+    # アーカイブにある日（datetime.date の配列）
+    @property
+    def dates(self):
+        rows = np.asarray(self.index['day_rows'], dtype=np.int64)
+        return day_dates(self.index['first_day'] + np.flatnonzero(np.diff(rows) > 0))
+
+    # 期間（開始 <= 時刻 <= 終了）の測定値。日の索引で範囲を絞ってから時刻で切り出す（どちらもビュー）
+    def series(self, start=None, end=None):
+        series = GlucoseSeries(self.seconds, self.glucose)
+        if (start is None and end is None) or not len(self):
+            return series
+        rows, first_day = self.index['day_rows'], self.index['first_day']
+        times = series['time']
+        start = pd.Timestamp(times[0] if start is None else start)
+        end = pd.Timestamp(times[-1] if end is None else end)
+        i = int(np.datetime64(start.date(), 'D').astype(np.int64)) - first_day
+        j = int(np.datetime64(end.date(), 'D').astype(np.int64)) - first_day + 1
+        i, j = min(max(i, 0), len(rows) - 1), min(max(j, 0), len(rows) - 1)
+        return time_range(series[rows[i]:rows[max(i, j)]], start, end)
+
+
+# 既存のアーカイブを開く（取り込みをしていない患者はエラー）
+def open_archive(patient, archive_dir=None):
+    path = archive_path(patient, archive_dir)
+    if not os.path.exists(os.path.join(path, _INDEX)):
+        raise FileNotFoundError(f'No archive for {patient!r} in {os.path.dirname(path)} (run glucose_archive.py import first)')
+    return GlucoseArchive(path)
+
+
+# 新しい測定値のうち、アーカイブに無いもの（同じ時刻・同じ値の行は重複とみなす）を時刻順で返す
+# 同じ時刻で値の異なる測定値は、渡された順番のまま残す
+def _new_readings(archive, seconds, glucose):
+    ok = ~np.isnan(glucose)
+    seconds, glucose = seconds[ok], glucose[ok]
+    if len(seconds) == 0:
+        return seconds, glucose
+    if not (seconds[1:] >= seconds[:-1]).all():
+        order = np.argsort(seconds, kind='stable')
+        seconds, glucose = seconds[order], glucose[order]
+    lo = int(np.searchsorted(archive.seconds, seconds.min(), side='left'))
+    hi = int(np.searchsorted(archive.seconds, seconds.max(), side='right'))
+    all_seconds = np.r_[archive.seconds[lo:hi], seconds]
+    all_glucose = np.r_[archive.glucose[lo:hi], glucose]
+    new = np.r_[np.zeros(hi - lo, dtype=bool), np.ones(len(seconds), dtype=bool)]
+    order = np.lexsort((new, all_glucose, all_seconds))
+    s, g = all_seconds[order], all_glucose[order]
+    keep = np.empty(len(order), dtype=bool)
+    keep[order] = new[order] & ~np.r_[False, (s[1:] == s[:-1]) & (g[1:] == g[:-1])]
+    keep = keep[hi - lo:]
+    return seconds[keep], glucose[keep]
+
+
+def _write_index(path, index):
+    tmp = os.path.join(path, f'{_INDEX}.tmp-{os.getpid()}')
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        json.dump(index, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, os.path.join(path, _INDEX))
+
+
+# 前の世代の列のファイルを削除する（開いている読み込み側がある環境では次回に削除する）
+def _remove_old_generations(path, generation):
+    keep = {os.path.basename(f) for f in _column_files(path, generation)}
+    for name in os.listdir(path):
+        if name.startswith(('time-', 'glucose-')) and name not in keep:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+
+
+# 測定値をアーカイブに取り込む。重複を除いた新しい測定値が全て最後の時刻以降なら列の末尾に追記し、
+# それより前の測定値（過去のエクスポートの追加）がある場合は、並べ直した列を新しい世代として書き出す
+# 戻り値: 追加した件数
+def append_readings(path, seconds, glucose):
+    os.makedirs(path, exist_ok=True)
+    archive = GlucoseArchive(path)
+    seconds, glucose = _new_readings(archive, np.asarray(seconds, dtype=np.int64), np.asarray(glucose, dtype=np.float32))
+    if len(seconds) == 0:
+        return 0
+    index = dict(archive.index)
+    count = len(archive)
+    if count == 0 or seconds[0] >= archive.seconds[-1]:
+        files = _column_files(path, index['generation'])
+        for file, values in zip(files, (seconds, glucose)):
+            with open(file, 'ab') as fp:
+                fp.truncate(count * values.itemsize)
+                fp.write(values.tobytes())
+                fp.flush()
+                os.fsync(fp.fileno())
+        all_seconds = _map(files[0], np.int64, count + len(seconds))
+    else:
+        all_seconds = np.r_[archive.seconds, seconds]
+        all_glucose = np.r_[archive.glucose, glucose]
+        order = np.argsort(all_seconds, kind='stable')
+        all_seconds, all_glucose = all_seconds[order], all_glucose[order]
+        index['generation'] += 1
+        for file, values in zip(_column_files(path, index['generation']), (all_seconds, all_glucose)):
+            with open(file, 'wb') as fp:
+                fp.write(values.tobytes())
+                fp.flush()
+                os.fsync(fp.fileno())
+    index['count'] = count + len(seconds)
+    index['first_day'], index['day_rows'] = _day_rows(all_seconds)
+    del archive, all_seconds
+    _write_index(path, index)
+    _remove_old_generations(path, index['generation'])
+    return len(seconds)
+
+
+# CSV のエクスポートを患者のアーカイブに取り込む（患者名はファイル名から。例: 240103_kishimoto.csv -> kishimoto）
+# 戻り値: (アーカイブのパス, 追加した件数, 取り込み後の件数)
+def import_csv(csv_file, archive_dir=None, patient=None):
+    path = archive_path(patient or patient_name(csv_file), archive_dir)
+    series = load_glucose_csv(csv_file, compact=True)
+    added = append_readings(path, series.seconds, series.glucose)
+    return path, added, len(GlucoseArchive(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-patient append-only memory-mapped glucose archive')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help='append CSV exports to the per-patient archives (duplicate readings are dropped)')
+    p_import.add_argument('csv_files', nargs='+')
+    p_import.add_argument('--patient', help='archive name (default: from the file name, e.g. 240103_kishimoto.csv -> kishimoto)')
+    p_info = sub.add_parser('info', help='print the readings and date range of an archive')
+    p_info.add_argument('patient')
+    p_info.add_argument('--start')
+    p_info.add_argument('--end')
+    for p in (p_import, p_info):
+        p.add_argument('--archive-dir', help=f'default: $GLUCOSE_ARCHIVE_DIR or {ARCHIVE_DIR_NAME}')
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        for csv_file in args.csv_files:
+            path, added, total = import_csv(csv_file, args.archive_dir, args.patient)
+            print(f'{csv_file} -> {path}: {added} new reading(s), {total} total')
+    elif args.command == 'info':
+        archive = open_archive(args.patient, args.archive_dir)
+        series = archive.series(args.start, args.end)
+        times = series['time']
+        span = f'{times[0]} - {times[-1]}' if len(series) else 'no readings'
+        print(f'{archive.path}: {len(series)} of {len(archive)} readings, {len(archive.dates)} day(s), {span}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from glucose_io import load_glucose_csv, time_range, day_dates
+from glucose_stats import DAY_NIGHT_BINS, STAT_COLUMNS, check_bins, tag_buckets
+from glucose_store import patient_name
+
+
+# 1つのファイルを読み込み、期間内の時刻（1970-01-01 からの秒）とグルコース値を返す（ワーカープロセス内で実行）
+# 期間の指定がない場合はファイル全体を使う
+def load_patient(job):
+    series = load_glucose_csv(job['csv_file'], compact=True)
+    if len(series):
+        times = series['time']
+        series = time_range(series, job.get('start_date') or times[0], job.get('end_date') or times[-1])
+    return series.seconds, series.glucose
+
+
+# 全ファイルを読み込み、患者名 -> [(秒, グルコース値), ...] にする（同じ患者の複数のファイルはまとめる）
+def load_cohort(jobs, workers=None):
+    if workers == 1:
+        loaded = [load_patient(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            loaded = list(pool.map(load_patient, jobs, chunksize=8))
+    series = {}
+    for job, data in zip(jobs, loaded):
+        series.setdefault(job.get('patient') or patient_name(job['csv_file']), []).append(data)
+    return series
+
+
+# 同じ患者のファイルをつなげる。重なったエクスポートの同じ時刻・同じ値の行は1つにする
+def _merge_parts(parts):
+    seconds = np.concatenate([p[0] for p in parts])
+    glucose = np.concatenate([p[1] for p in parts]).astype(float)
+    if len(parts) > 1:
+        order = np.lexsort((glucose, seconds))
+        seconds, glucose = seconds[order], glucose[order]
+        keep = np.r_[True, (seconds[1:] != seconds[:-1]) | (glucose[1:] != glucose[:-1])]
+        seconds, glucose = seconds[keep], glucose[keep]
+    return seconds, glucose
+
+
+# 全患者の測定値を1つの長い表（患者, 区分, 日, グルコース値）にし、日別・期間の統計を1回ずつの集計で求める
+# 患者・区分・日は1つの整数のキーにまとめて集計し、最後に名前・ラベル・日付に戻す
+# 戻り値: (daily, period)
+#   daily  : 列 patient, bucket, Date, mean, std, count, min, max（患者・区分・日付順）
+#   period : 列 patient, bucket, mean, std, count, min, max, days（全患者 × 全区分。測定の無い区分は NaN）
+def cohort_bucket_stats(series, bins=DAY_NIGHT_BINS):
+    bins = check_bins(bins)
+    labels = [b[0] for b in bins]
+    patients = list(series)
+    merged = [_merge_parts(series[name]) for name in patients]
+    seconds = np.concatenate([m[0] for m in merged]) if merged else np.empty(0, dtype=np.int64)
+    glucose = np.concatenate([m[1] for m in merged]) if merged else np.empty(0)
+    patient = np.repeat(np.arange(len(patients), dtype=np.int64), [len(m[0]) for m in merged])
+
+    bucket = tag_buckets(seconds.view('datetime64[s]'), bins)
+    keep = (bucket >= 0) & ~np.isnan(glucose)
+    patient, bucket, glucose = patient[keep], bucket[keep], glucose[keep]
+    day = seconds[keep] // 86400
+    first_day = int(day.min()) if len(day) else 0
+    n_days = int(day.max()) - first_day + 1 if len(day) else 1
+
+    # 日別の統計（キー = (患者 × 区分数 + 区分) × 日数 + 日）
+    group = patient * len(bins) + bucket
+    frame = pd.DataFrame({'glucose': glucose})
+    daily = frame.groupby(group * n_days + (day - first_day))['glucose'].agg(STAT_COLUMNS)
+    key = daily.index.to_numpy()
+    daily_group = key // n_days
+    daily.insert(0, 'Date', day_dates(key % n_days + first_day))
+    daily.insert(0, 'bucket', pd.Categorical.from_codes(daily_group % len(bins), categories=labels))
+    daily.insert(0, 'patient', np.array(patients, dtype=object)[daily_group // len(bins)])
+
+    # 期間の統計（患者 × 区分）。測定日数も付ける
+    period = frame.groupby(group)['glucose'].agg(STAT_COLUMNS)
+    period['days'] = pd.Series(daily_group).value_counts()
+    period = period.reindex(np.arange(len(patients) * len(bins)))
+    period['count'] = period['count'].fillna(0).astype(int)
+    period['days'] = period['days'].fillna(0).astype(int)
+    full = period.index.to_numpy()
+    period.insert(0, 'bucket', pd.Categorical.from_codes(full % len(bins), categories=labels))
+    period.insert(0, 'patient', np.array(patients, dtype=object)[full // len(bins)])
+    return daily.reset_index(drop=True), period.reset_index(drop=True)
+
+
+# 表を拡張子に応じて CSV または Parquet で保存する（Parquet は pyarrow が必要）
+def write_table(df, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+# フォルダ内の全 CSV、またはマニフェスト（列: csv_file [, patient, start_date, end_date]）をジョブにする
+def cohort_jobs(source, start_date=None, end_date=None):
+    if os.path.isdir(source):
+        jobs = [{'csv_file': f} for f in sorted(glob.glob(os.path.join(source, '*.csv')))]
+    else:
+        from report_batch import read_manifest
+        jobs = read_manifest(source)
+    for job in jobs:
+        if start_date:
+            job.setdefault('start_date', start_date)
+        if end_date:
+            job.setdefault('end_date', end_date)
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='0-6 h / 6-24 h summary table for a whole cohort in one aggregation')
+    parser.add_argument('source', help='directory of CSV files, or a manifest CSV (csv_file [, patient, start_date, end_date])')
+    parser.add_argument('--start', help='start date (default: first reading of each file)')
+    parser.add_argument('--end', help='end date (default: last reading of each file)')
+    parser.add_argument('-o', '--output', default='cohort_summary.csv', help='period summary per patient and bucket (.csv or .parquet)')
+    parser.add_argument('--daily', help='also write the per-day table (.csv or .parquet)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='processes for loading files (default: CPU count)')
+    parser.add_argument('--charts', metavar='OUT_DIR', help='also render the monthly report for every file into OUT_DIR')
+    parser.add_argument('--template-dir', default='.')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    jobs = cohort_jobs(args.source, args.start, args.end)
+    series = load_cohort(jobs, args.jobs)
+    loaded = time.perf_counter()
+    daily, period = cohort_bucket_stats(series)
+    write_table(period, args.output)
+    if args.daily:
+        write_table(daily, args.daily)
+    print(f'{len(series)} patients, {len(jobs)} files, {int(period["count"].sum())} readings: '
+          f'load {loaded - started:.2f}s, stats {time.perf_counter() - loaded:.2f}s -> {args.output}')
+
+    # グラフは指定した場合だけ作る（バッチ処理と同じく並列で実行）
+    if args.charts:
+        from report_batch import run_batch, print_summary
+        chart_jobs = [dict(job, report='monthly') for job in jobs]
+        chart_started = time.perf_counter()
+        results = run_batch(chart_jobs, args.charts, args.template_dir, args.jobs)
+        print_summary(results, time.perf_counter() - chart_started)
+        return 0 if all(r['ok'] for r in results) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+from glucose_overlay import smooth_segment
+
+# イベントファイルの列名（別名 -> 正式名）
+_EVENT_COLUMNS = {'start': 'time_start', 'mid': 'time_mid', 'end': 'time_end'}
+
+
+# イベント（試合）ファイルを読み込む。列: start, mid, end [, label]（time_start / time_mid / time_end も可）
+# 戻り値: 開始時刻順の [{'time_start', 'time_mid', 'time_end', 'label'}, ...]
+def read_events(path):
+    events = pd.read_csv(path, dtype=str, encoding='utf-8-sig', skipinitialspace=True)
+    events = events.rename(columns=lambda c: _EVENT_COLUMNS.get(c.strip(), c.strip()))
+    return normalize_events(events.to_dict('records'))
+
+
+# イベントの時刻を Timestamp にし、開始 <= 中間 <= 終了 を確認して開始時刻順に並べる
+def normalize_events(events):
+    result = []
+    for i, event in enumerate(events):
+        start, mid, end = (pd.Timestamp(event[key]) for key in ('time_start', 'time_mid', 'time_end'))
+        if not start <= mid <= end:
+            raise ValueError(f'Event {i + 1}: expected start <= mid <= end, got {start} / {mid} / {end}')
+        label = event.get('label')
+        label = '' if label is None or pd.isna(label) else str(label).strip()
+        result.append({'time_start': start, 'time_mid': mid, 'time_end': end, 'label': label})
+    return sorted(result, key=lambda e: e['time_start'])
+
+
+# 時刻順の配列から各イベントの区間の位置を二分探索で求める
+# 戻り値: (n_events, 4) の整数配列 [開始, 中間（より前の終わり）, 中間（以下の終わり）, 終了]
+#   試合前の統計 [開始, 中間以下) / 試合中の統計 [中間以下, 終了)
+#   青の区間   [開始, 中間より前) / 赤の区間   [中間より前, 終了)
+def event_bounds(times, events):
+    t = np.asarray(times, dtype='datetime64[ns]')
+    starts, mids, ends = (np.array([e[key] for e in events], dtype='datetime64[ns]')
+                          for key in ('time_start', 'time_mid', 'time_end'))
+    return np.column_stack([
+        np.searchsorted(t, starts, side='left'),
+        np.searchsorted(t, mids, side='left'),
+        np.searchsorted(t, mids, side='right'),
+        np.searchsorted(t, ends, side='right'),
+    ])
+
+
+# 欠測を除いた平均値と最大値（データが無ければ NaN）
+def _mean_max(g):
+    g = g[~np.isnan(g)]
+    if len(g) == 0:
+        return np.nan, np.nan
+    return float(g.mean()), float(g.max())
+
+
+# 1つのイベントの統計量と曲線を求める（x は mdates の数値）
+# 中間時刻に両区間の境界の平均値の点を加え、青と赤の曲線をつなげる
+def event_curves(x, g, bounds, time_mid, smooth=None, points=100):
+    i0, mid_lo, mid_hi, i1 = bounds
+    avg_before, max_before = _mean_max(g[i0:mid_hi])
+    avg_during, max_during = _mean_max(g[mid_hi:i1])
+
+    x_blue, y_blue = x[i0:mid_lo], g[i0:mid_lo]
+    x_red, y_red = x[mid_lo:i1], g[mid_lo:i1]
+    x_mid = mdates.date2num(time_mid)
+    curve_blue, curve_red = (x_blue, y_blue), (x_red, y_red)
+    if len(x_blue) and len(x_red):
+        mid_value = (y_blue[-1] + y_red[0]) / 2
+        curve_blue = (np.append(x_blue, x_mid), np.append(y_blue, mid_value))
+        if x_red[0] != x_mid:
+            curve_red = (np.insert(x_red, 0, x_mid), np.insert(y_red, 0, mid_value))
+
+    # 曲線を作成（重複を排除する。smooth を指定したときだけ平滑化する）
+    curves = []
+    for cx, cy in (curve_blue, curve_red):
+        cx, unique_indices = np.unique(cx, return_index=True)
+        curves.append(smooth_segment(cx, cy[unique_indices], smooth, points))
+
+    return {
+        'avg_before': avg_before, 'max_before': max_before,
+        'avg_during': avg_during, 'max_during': max_during,
+        'blue_curve': curves[0], 'red_curve': curves[1],
+        'blue_points': (x_blue, y_blue), 'red_points': (x_red, y_red),
+    }
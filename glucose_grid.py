@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+from glucose_io import time_values, day_dates
+from glucose_overlay import BASE_DATE, TIME_THRESHOLD
+from glucose_stats import DAY_NIGHT_BINS, STAT_COLUMNS, check_bins
+
+# 格子の既定の間隔（分）。5分なら1日 288 スロット
+GRID_MINUTES = 5
+
+
+# 同じ時刻の測定値を平均して1つにする（時刻順であること）
+def _unique_times(seconds, glucose):
+    new = np.r_[True, seconds[1:] != seconds[:-1]]
+    if new.all():
+        return seconds, glucose
+    point = np.cumsum(new) - 1
+    return seconds[new], np.bincount(point, weights=glucose) / np.bincount(point)
+
+
+# NaN を除いた軸方向の統計量（mean, std, count, min, max）。測定の無い行・列は NaN（count は 0）
+def _reduce(values, axis):
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=axis)
+    v = np.where(valid, values, 0.0).astype(float)
+    s = v.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s / count
+        sq = (np.where(valid, values - np.expand_dims(mean, axis), 0.0) ** 2).sum(axis=axis)
+        std = np.sqrt(sq / (count - 1))
+    std[count < 2] = np.nan
+    vmin = np.where(valid, values, np.inf).min(axis=axis) if values.size else np.full(count.shape, np.inf)
+    vmax = np.where(valid, values, -np.inf).max(axis=axis) if values.size else np.full(count.shape, -np.inf)
+    return pd.DataFrame({'mean': mean, 'std': std, 'count': count,
+                         'min': np.where(count > 0, vmin, np.nan), 'max': np.where(count > 0, vmax, np.nan)})
+
+
+# 日 × 時刻スロットの規則的な格子（values[日, スロット]、float32、測定の無いスロットは NaN）
+# 日ごとの統計は行方向、時刻ごとの統計は列方向の集計になり、日ごとの線は行を取り出すだけで描ける
+#   first_day : 最初の行の日番号（1970-01-01 からの日数）
+#   minutes   : スロットの間隔（分）
+class DayGrid:
+    def __init__(self, values, first_day, minutes=GRID_MINUTES):
+        self.values = values
+        self.first_day = int(first_day)
+        self.minutes = minutes
+
+    # 時刻順の測定値を格子に載せる。スロットの時刻の値は前後の測定値から線形補間し、
+    # 前後の測定の間隔が time_threshold を超える（欠測）スロットは NaN にする
+    # df は DataFrame または GlucoseSeries（列 time, glucose）
+    @classmethod
+    def from_series(cls, df, minutes=GRID_MINUTES, time_threshold=TIME_THRESHOLD):
+        if (24 * 60) % minutes:
+            raise ValueError(f'Grid interval must divide a day: {minutes} minutes')
+        slots = (24 * 60) // minutes
+        t = time_values(df['time'])
+        g = np.asarray(df['glucose'], dtype=float)
+        ok = ~np.isnan(g)
+        seconds = t[ok].astype('datetime64[s]').view(np.int64)
+        g = g[ok]
+        if len(seconds) == 0:
+            return cls(np.empty((0, slots), dtype=np.float32), 0, minutes)
+        if not (seconds[1:] >= seconds[:-1]).all():
+            order = np.argsort(seconds, kind='stable')
+            seconds, g = seconds[order], g[order]
+        seconds, g = _unique_times(seconds, g)
+
+        first_day = seconds[0] // 86400
+        n_days = seconds[-1] // 86400 - first_day + 1
+        step = minutes * 60
+        slot_seconds = first_day * 86400 + np.arange(n_days * slots, dtype=np.int64) * step
+
+        # スロットの直前（同時刻を含む）の測定と直後の測定の間隔で欠測を判定する
+        before = np.searchsorted(seconds, slot_seconds, side='right') - 1
+        after = np.minimum(before + 1, len(seconds) - 1)
+        exact = (before >= 0) & (seconds[np.clip(before, 0, None)] == slot_seconds)
+        limit = time_threshold / pd.Timedelta(seconds=1)
+        bridged = (before >= 0) & (before + 1 < len(seconds)) & (seconds[after] - seconds[np.clip(before, 0, None)] <= limit)
+        values = np.interp(slot_seconds, seconds, g)
+        values[~(exact | bridged)] = np.nan
+        return cls(values.astype(np.float32).reshape(n_days, slots), first_day, minutes)
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def slots(self):
+        return self.values.shape[1]
+
+    # 各行の日付（datetime.date）
+    @property
+    def dates(self):
+        return day_dates(self.first_day + np.arange(len(self)))
+
+    # 各スロットの時刻（0時からの時間）
+    def slot_hours(self):
+        return np.arange(self.slots) * self.minutes / 60
+
+    # 開始日〜終了日（日単位、両端を含む）の行だけの格子（コピーしない）
+    def day_range(self, start_date, end_date):
+        start = int(np.datetime64(pd.Timestamp(start_date).date(), 'D').astype(np.int64)) - self.first_day
+        end = int(np.datetime64(pd.Timestamp(end_date).date(), 'D').astype(np.int64)) - self.first_day
+        start, end = max(start, 0), min(max(end + 1, 0), len(self))
+        return DayGrid(self.values[start:max(start, end)], self.first_day + start, self.minutes)
+
+    # 日ごとの統計（行方向の集計）。インデックスは日付、列は mean, std, count, min, max
+    def day_stats(self):
+        stats = _reduce(self.values, axis=1)
+        stats.index = pd.Index(self.dates, name='Date')
+        return stats
+
+    # 時刻スロットごとの統計（列方向の集計）。インデックスは 0時からの時間
+    def slot_stats(self):
+        stats = _reduce(self.values, axis=0)
+        stats.index = pd.Index(self.slot_hours(), name='hour')
+        return stats
+
+    # 時刻スロットごとのパーセンタイル（q は 0-100 のリスト）。戻り値の形は (len(q), slots)
+    def percentiles(self, q):
+        values = self.values.astype(float)
+        out = np.full((len(q), self.slots), np.nan)
+        has = (~np.isnan(values)).any(axis=0)
+        if has.any():
+            out[:, has] = np.nanpercentile(values[:, has], q, axis=0)
+        return out
+
+    # 時間帯区分ごとの日別統計と期間統計（glucose_stats.bucket_stats と同じ形の (daily, period)）
+    # 区分はスロットの列の範囲になるため、時刻の判定は不要。格子の値は時間で重み付けした値になる
+    def bucket_stats(self, bins=DAY_NIGHT_BINS):
+        bins = check_bins(bins)
+        labels = [b[0] for b in bins]
+        hours = self.slot_hours()
+        daily, period = [], []
+        for label, start, end in bins:
+            columns = (hours >= start) & (hours < end)
+            block = self.values[:, columns]
+            stats = _reduce(block, axis=1)
+            stats.insert(0, 'Date', self.dates)
+            stats.insert(0, 'bucket', label)
+            daily.append(stats[stats['count'] > 0])
+            period.append(_reduce(block.reshape(1, -1), axis=1))
+        daily = pd.concat(daily, ignore_index=True)
+        daily['bucket'] = pd.Categorical(daily['bucket'], categories=labels)
+        period = pd.concat(period, ignore_index=True)
+        period.index = pd.Index(labels, name='bucket')
+        return daily[['bucket', 'Date'] + STAT_COLUMNS], period[STAT_COLUMNS]
+
+    # 日ごとの重ね描き用のセグメント（split_daily_segments と同じ形の (segments, segment_days)）
+    # 各行を NaN（欠測）で区切るだけで作る。点が2つ未満のセグメントは描画しない
+    def overlay_segments(self, base_date=BASE_DATE):
+        valid = ~np.isnan(self.values)
+        flat = valid.ravel()
+        row = np.repeat(np.arange(len(self)), self.slots)
+        starts = np.flatnonzero(flat & ~np.r_[False, flat[:-1]] | flat & (np.r_[-1, row[:-1]] != row))
+        ends = np.flatnonzero(flat & ~np.r_[flat[1:], False] | flat & (np.r_[row[1:], -1] != row)) + 1
+        keep = (ends - starts) >= 2
+        x = mdates.date2num(base_date) + self.slot_hours() / 24
+        values = self.values.ravel()
+        dates = self.dates
+        segments = [np.column_stack((x[s % self.slots:(e - 1) % self.slots + 1], values[s:e].astype(float)))
+                    for s, e in zip(starts[keep], ends[keep])]
+        return segments, [dates[s // self.slots] for s in starts[keep]]
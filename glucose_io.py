@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+
+# キャッシュの保存先（環境変数で変更可能。既定は CSV と同じフォルダの .glucose_cache）
+CACHE_DIR_NAME = '.glucose_cache'
+CACHE_VERSION = 3
+
+
+def default_cache_dir(csv_file):
+    return os.environ.get('GLUCOSE_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(csv_file)), CACHE_DIR_NAME)
+
+
+# 元ファイルのパス・サイズ・更新時刻からキャッシュのキーを作る
+def _source_stat(csv_file):
+    path = os.path.abspath(csv_file)
+    st = os.stat(path)
+    return {'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _cache_entry(csv_file, cache_dir):
+    source = _source_stat(csv_file)
+    key = hashlib.sha1(f"{source['path']}|{source['size']}|{source['mtime_ns']}".encode('utf-8')).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(csv_file))[0]
+    return os.path.join(cache_dir, f'{stem}-{key}'), source
+
+
+# キャッシュから読み込む（数値・日時の列はメモリマップで開く）
+def _read_cache(entry, source):
+    with open(os.path.join(entry, 'meta.json'), encoding='utf-8') as fp:
+        meta = json.load(fp)
+    if meta.get('version') != CACHE_VERSION or meta.get('source') != source:
+        return None
+    columns = {}
+    for col in meta['columns']:
+        if col['kind'] == 'text':
+            values = np.load(os.path.join(entry, col['file']))
+            columns[col['name']] = pd.Series(values, dtype=object).replace('', np.nan)
+        else:
+            columns[col['name']] = np.load(os.path.join(entry, col['file']), mmap_mode='r')
+    return pd.DataFrame(columns, copy=False)
+
+
+# 列ごとに .npy として書き出す（書きかけのキャッシュを読まないよう一時フォルダから置き換える）
+def _write_cache(entry, source, df):
+    tmp = f'{entry}.tmp-{os.getpid()}'
+    os.makedirs(tmp, exist_ok=True)
+    meta = {'version': CACHE_VERSION, 'source': source, 'columns': []}
+    for i, name in enumerate(df.columns):
+        values = df[name].to_numpy()
+        if values.dtype.kind in 'biufM':
+            kind = 'array'
+        else:
+            kind = 'text'
+            values = df[name].fillna('').astype(str).to_numpy(dtype=str)
+        file = f'col{i}.npy'
+        np.save(os.path.join(tmp, file), values)
+        meta['columns'].append({'name': str(name), 'file': file, 'kind': kind})
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as fp:
+        json.dump(meta, fp, ensure_ascii=False)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+
+# 読み込んだ測定値のコンパクトな表現（大人数・長期間のデータ向け）
+#   seconds : 時刻（1970-01-01 からの秒, int64）。['time'] ではコピーせず datetime64[s] として見せる
+#   glucose : グルコース値（float32。欠測は NaN）
+#   days    : 日番号（1970-01-01 からの日数, int32）。.dt.date の date オブジェクトの代わりに集計に使う
+# DataFrame と同じく ['time'] / ['glucose'] で列を取り出せ、len() と [i:j]（ビュー）に対応する
+class GlucoseSeries:
+    __slots__ = ('seconds', 'glucose')
+
+    def __init__(self, seconds, glucose):
+        self.seconds = np.asarray(seconds, dtype=np.int64)
+        self.glucose = np.asarray(glucose, dtype=np.float32)
+        if self.seconds.shape != self.glucose.shape:
+            raise ValueError('seconds and glucose must have the same length')
+
+    # 列 time, glucose を持つ DataFrame（時刻順）から作る。ほかの列は持たない
+    @classmethod
+    def from_frame(cls, df):
+        t = df['time'].to_numpy(dtype='datetime64[s]')
+        return cls(t.view(np.int64), df['glucose'].to_numpy(dtype=np.float32))
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return GlucoseSeries(self.seconds[key], self.glucose[key])
+        if key == 'time':
+            return self.seconds.view('datetime64[s]')
+        if key == 'glucose':
+            return self.glucose
+        raise KeyError(key)
+
+    @property
+    def days(self):
+        return (self.seconds // 86400).astype(np.int32)
+
+    @property
+    def nbytes(self):
+        return self.seconds.nbytes + self.glucose.nbytes
+
+    def to_frame(self):
+        return pd.DataFrame({'time': self['time'].astype('datetime64[ns]'), 'glucose': self.glucose.astype(float)})
+
+
+# 時刻の配列（DataFrame の列・GlucoseSeries の列）を datetime64 の配列にする（単位はそのまま）
+def time_values(times):
+    t = np.asarray(times)
+    return t if t.dtype.kind == 'M' else t.astype('datetime64[ns]')
+
+
+# 時刻を日番号（1970-01-01 からの日数, int64）にする。日ごとの集計のキーに使う
+def day_numbers(times):
+    return time_values(times).astype('datetime64[D]').view(np.int64)
+
+
+# 日番号を datetime.date の配列（dtype object。表・凡例用）にする
+def day_dates(days):
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype(object)
+
+
+# 時刻順に並べ（同時刻は元の順番を保つ）、時刻の無い行と重複行（時刻・グルコース値が同じ行。最初の行を残す）を除く
+# 重複の判定は時刻とグルコース値だけで行う（他の列が違っても同じ測定値とみなす。stream_bucket_stats と同じ）
+def sort_glucose(df):
+    df = df.dropna(subset=['time'])
+    t = df['time'].to_numpy(dtype='datetime64[ns]')
+    if len(t) > 1 and not (t[1:] >= t[:-1]).all():
+        df = df.iloc[np.argsort(t, kind='stable')]
+    return df.drop_duplicates(subset=['time', 'glucose']).reset_index(drop=True)
+
+
+# 期間（開始 <= 時刻 <= 終了）の行の位置を二分探索で求める。df は時刻順であること
+# 境界の時刻はデータの時刻の単位に丸める（開始は切り上げ、終了は切り捨て）ので、配列全体の変換は起きない
+def range_bounds(df, start, end):
+    t = time_values(df['time'])
+    unit = np.datetime_data(t.dtype)[0]
+    return (int(np.searchsorted(t, np.datetime64(pd.Timestamp(start).ceil(unit), unit), side='left')),
+            int(np.searchsorted(t, np.datetime64(pd.Timestamp(end).floor(unit), unit), side='right')))
+
+
+# 期間（開始 <= 時刻 <= 終了）の行を取り出す。コピーせず元のデータの一部（ビュー）を返す
+def time_range(df, start, end):
+    i, j = range_bounds(df, start, end)
+    return df.iloc[i:j] if isinstance(df, pd.DataFrame) else df[i:j]
+
+
+# CSV を読み込む（時刻順・重複行なし）。元ファイルが変わっていなければ解析済みのキャッシュを使う
+# compact=True なら GlucoseSeries（時刻とグルコース値だけのコンパクトな表現）で返す
+def load_glucose_csv(csv_file, cache=True, cache_dir=None, compact=False):
+    df = _load_frame(csv_file, cache, cache_dir)
+    return GlucoseSeries.from_frame(df) if compact else df
+
+
+def _load_frame(csv_file, cache, cache_dir):
+    if not cache:
+        return sort_glucose(pd.read_csv(csv_file, parse_dates=['time']))
+    cache_dir = cache_dir or default_cache_dir(csv_file)
+    entry, source = _cache_entry(csv_file, cache_dir)
+    if os.path.isdir(entry):
+        try:
+            df = _read_cache(entry, source)
+            if df is not None:
+                return df
+        except (OSError, ValueError, KeyError):
+            pass
+    df = sort_glucose(pd.read_csv(csv_file, parse_dates=['time']))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_cache(entry, source, df)
+    except OSError as e:
+        print(f'Warning: could not write cache for {csv_file}: {e}', file=sys.stderr)
+    return df
+
+
+# 古いキャッシュ（元ファイルが削除・更新されたもの）を削除する。remove_all=True なら全て削除
+def clean_cache(cache_dir, remove_all=False):
+    removed = []
+    if not os.path.isdir(cache_dir):
+        return removed
+    for name in sorted(os.listdir(cache_dir)):
+        entry = os.path.join(cache_dir, name)
+        if not os.path.isdir(entry):
+            continue
+        stale = remove_all or '.tmp-' in name
+        if not stale:
+            try:
+                with open(os.path.join(entry, 'meta.json'), encoding='utf-8') as fp:
+                    meta = json.load(fp)
+                source = meta['source']
+                stale = (meta.get('version') != CACHE_VERSION
+                         or not os.path.exists(source['path'])
+                         or _source_stat(source['path']) != source)
+            except (OSError, ValueError, KeyError):
+                stale = True
+        if stale:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parsed CGM CSV cache')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_clean = sub.add_parser('clean', help='remove stale cache entries')
+    p_clean.add_argument('cache_dir', nargs='?', default=CACHE_DIR_NAME)
+    p_clean.add_argument('--all', action='store_true', help='remove every entry')
+    p_warm = sub.add_parser('warm', help='parse CSV files and store them in the cache')
+    p_warm.add_argument('csv_files', nargs='+')
+    p_warm.add_argument('--cache-dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'clean':
+        cache_dir = os.environ.get('GLUCOSE_CACHE_DIR') or args.cache_dir
+        for name in clean_cache(cache_dir, remove_all=args.all):
+            print(f'removed {name}')
+    elif args.command == 'warm':
+        for csv_file in args.csv_files:
+            df = load_glucose_csv(csv_file, cache_dir=args.cache_dir)
+            print(f'{csv_file}: {len(df)} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+from glucose_io import load_glucose_csv, time_range, time_values, day_numbers, day_dates
+from glucose_overlay import TIME_THRESHOLD
+from glucose_stats import DAY_NIGHT_BINS, check_bins, tag_buckets
+
+# 範囲のしきい値（mg/dL、国際コンセンサスの区分）
+#   tbr_54 : 54 未満        tbr_70 : 70 未満（54 未満を含む）
+#   tir    : 70 以上 180 以下
+#   tar_180: 180 超（250 超を含む）  tar_250 : 250 超
+LOW_2, LOW_1, HIGH_1, HIGH_2 = 54, 70, 180, 250
+
+# 出力する指標の列
+#   count   : 測定数      mean / sd : 平均値・標準偏差（mg/dL）   cv : 変動係数（%）
+#   gmi     : 推定 HbA1c（GMI, %）= 3.31 + 0.02392 × 平均値
+#   hours   : 測定でカバーされた時間（30分を超える欠測は含まない）
+#   tbr_54 / tbr_70 / tir / tar_180 / tar_250 : カバーされた時間に対する割合（%）
+#   auc     : 曲線下面積（mg/dL・時、台形公式）
+#   mage    : 平均血糖変動幅（MAGE, mg/dL。その日の SD を超える上昇・下降の振れ幅の平均）
+#   excursions : MAGE に数えた振れ幅の数
+METRIC_COLUMNS = ['count', 'mean', 'sd', 'cv', 'gmi', 'hours', 'tbr_54', 'tbr_70', 'tir', 'tar_180', 'tar_250',
+                  'auc', 'mage', 'excursions']
+
+# 分散計算の桁落ちを防ぐため、平方和はこの値を引いてから積算する（glucose_stats と同じ）
+_SHIFT = 100.0
+
+
+# 時刻順の測定値（欠測値を除く）と、隣の測定までの間隔から各測定値の重み（時間）を求める
+# 重みは前後の間隔の半分ずつの和（しきい値を超える欠測の間隔は数えない）。Σ 重み × 値 が台形公式の AUC になる
+def _readings(df, time_threshold):
+    t = time_values(df['time'])
+    g = np.asarray(df['glucose'], dtype=float)
+    ok = ~np.isnan(g)
+    t, g = t[ok], g[ok]
+    if len(t) > 1 and not (t[1:] >= t[:-1]).all():
+        order = np.argsort(t, kind='stable')
+        t, g = t[order], g[order]
+    hours = (t - t[0]) / np.timedelta64(1, 'h') if len(t) else np.empty(0)
+    dt = np.diff(hours)
+    limit = time_threshold / pd.Timedelta(hours=1)
+    step = np.where(dt <= limit, dt, 0.0)
+    weight = np.r_[0.0, step] / 2 + np.r_[step, 0.0] / 2
+    return t, g, weight, dt <= limit
+
+
+# 区分（キー）ごとに測定数・平均・SD・範囲内の時間・AUC を積算して指標の表にする（np.bincount で1回ずつ）
+def _aggregate(key, n, g, weight):
+    def total(values=None):
+        return np.bincount(key, weights=values, minlength=n)[:n]
+    count = total()
+    shifted = g - _SHIFT
+    s = total(shifted)
+    ss = total(shifted * shifted)
+    hours = total(weight)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s / count + _SHIFT
+        sd = np.sqrt(np.clip((ss - s * s / count) / (count - 1), 0, None))
+        sd[count < 2] = np.nan
+        table = {'count': count.astype(int), 'mean': mean, 'sd': sd, 'cv': sd / mean * 100,
+                 'gmi': 3.31 + 0.02392 * mean, 'hours': hours}
+        for name, mask in (('tbr_54', g < LOW_2), ('tbr_70', g < LOW_1), ('tir', (g >= LOW_1) & (g <= HIGH_1)),
+                           ('tar_180', g > HIGH_1), ('tar_250', g > HIGH_2)):
+            table[name] = total(weight * mask) / hours * 100
+    table['auc'] = total(weight * g)
+    return pd.DataFrame(table)
+
+
+# 各セグメント（日付の変わり目・しきい値を超える欠測で区切る）の極値の列から、しきい値未満の小さな振れを除き、
+# 残った振れ幅（MAGE の対象）を返す。小さな振れは、振れ幅が前後より小さいもの（局所最小）から
+# 山と谷の組で取り除く（残る山・谷は元の列のより大きな極値になる）。1回の処理は配列全体に対して行う
+# 戻り値: (振れ幅, 振れの終わりの測定値の位置)
+def _excursions(g, segment, threshold):
+    # 同じ値が続く点は最初の1つにし、セグメントの両端と傾きの向きが変わる点を極値とする
+    keep = np.r_[True, (g[1:] != g[:-1]) | (segment[1:] != segment[:-1])]
+    idx = np.flatnonzero(keep)
+    v, seg = g[idx], segment[idx]
+    first = np.r_[True, seg[1:] != seg[:-1]]
+    last = np.r_[seg[1:] != seg[:-1], True]
+    d = np.diff(v)
+    turning = first | last
+    turning[1:-1] |= d[:-1] * d[1:] < 0
+    idx, v, seg = idx[turning], v[turning], seg[turning]
+    thr = threshold[idx]
+
+    while len(v) > 1:
+        same = seg[1:] == seg[:-1]
+        amp = np.where(same, np.abs(np.diff(v)), np.inf)
+        small = amp < thr[:-1]
+        if not small.any():
+            break
+        left = np.r_[np.inf, amp[:-1]]
+        right = np.r_[amp[1:], np.inf]
+        interior = np.r_[False, same[:-1]] & np.r_[same[1:], False]
+        start = ~np.r_[False, same[:-1]]
+        end = ~np.r_[same[1:], False]
+        drop = np.zeros(len(v), dtype=bool)
+        # 内側の組（山と谷）: 振れ幅が左より小さく、右以下
+        pair = small & interior & (amp < left) & (amp <= right)
+        drop[:-1] |= pair
+        drop[1:] |= pair
+        # セグメントの端の小さな振れは端の点を除く
+        drop[:-1] |= small & start & (amp <= right)
+        drop[1:] |= small & end & (amp < left)
+        idx, v, seg, thr = idx[~drop], v[~drop], seg[~drop], thr[~drop]
+
+    same = seg[1:] == seg[:-1]
+    return np.abs(np.diff(v))[same], idx[1:][same]
+
+
+# 振れ幅をキーごとに平均する（振れの無いキーは NaN）
+def _mage(key, n, amplitude, at):
+    count = np.bincount(key[at], minlength=n)[:n]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.bincount(key[at], weights=amplitude, minlength=n)[:n] / count, count
+
+
+# 日別・時間帯区分別・期間全体の CGM 指標を、時刻順の測定値への1回の処理で求める
+# df は DataFrame または GlucoseSeries（列 time, glucose）。30分（time_threshold）を超える欠測は時間に数えない
+# 戻り値: {'daily': 日付をインデックスとする表, 'buckets': 区分ラベルをインデックスとする表, 'period': 1行の表}
+def cgm_metrics(df, bins=DAY_NIGHT_BINS, time_threshold=TIME_THRESHOLD):
+    bins = check_bins(bins)
+    labels = [b[0] for b in bins]
+    t, g, weight, joined = _readings(df, time_threshold)
+
+    # 日別（日番号を 0 からの位置にする）
+    days = day_numbers(t)
+    first_day = int(days[0]) if len(days) else 0
+    day_key = days - first_day
+    n_days = int(day_key[-1]) + 1 if len(day_key) else 0
+    daily = _aggregate(day_key, n_days, g, weight)
+
+    # MAGE: 日付の変わり目・欠測でセグメントを区切り、その日の SD をしきい値にする
+    segment = np.cumsum(np.r_[True, ~joined | (days[1:] != days[:-1])])
+    threshold = np.nan_to_num(daily['sd'].to_numpy(), nan=np.inf)[day_key]
+    amplitude, at = _excursions(g, segment, threshold) if len(g) else (np.empty(0), np.empty(0, dtype=int))
+    daily['mage'], daily['excursions'] = _mage(day_key, n_days, amplitude, at)
+    daily = daily[daily['count'] > 0]
+    daily.index = pd.Index(day_dates(daily.index.to_numpy() + first_day), name='Date')
+
+    # 時間帯区分別（どの区分にも入らない測定値は数えない）
+    bucket = tag_buckets(t, bins)
+    inside = bucket >= 0
+    buckets = _aggregate(bucket[inside], len(bins), g[inside], weight[inside])
+    buckets['mage'], buckets['excursions'] = _mage(np.where(inside, bucket, len(bins)), len(bins), amplitude, at)
+    buckets.index = pd.Index(labels, name='bucket')
+
+    # 期間全体
+    period = _aggregate(np.zeros(len(g), dtype=np.int64), 1, g, weight)
+    period['mage'], period['excursions'] = _mage(np.zeros(len(g), dtype=np.int64), 1, amplitude, at)
+    period.index = pd.Index(['period'], name='period')
+    return {'daily': daily[METRIC_COLUMNS], 'buckets': buckets[METRIC_COLUMNS], 'period': period[METRIC_COLUMNS]}
+
+
+# 3つの表を1つの長い表（列 level, key, 指標...）にする（CSV 出力用）
+def metrics_table(metrics):
+    parts = []
+    for level in ('period', 'buckets', 'daily'):
+        table = metrics[level].reset_index()
+        key = table.columns[0]
+        parts.append(table.rename(columns={key: 'key'}).assign(level=level))
+    table = pd.concat(parts, ignore_index=True)
+    return table[['level', 'key'] + METRIC_COLUMNS]
+
+
+# レポートのテキストボックス用の2行（期間全体の指標。値が無いものは -）
+def format_metrics(row):
+    def value(name, spec, unit):
+        return f'{row[name]:{spec}}{unit}' if pd.notna(row[name]) else '-'
+    return (f"TIR {value('tir', '.0f', '%')} (TBR {value('tbr_70', '.0f', '%')}, TAR {value('tar_180', '.0f', '%')})\n"
+            f"CV {value('cv', '.1f', '%')}, GMI {value('gmi', '.1f', '%')}, MAGE {value('mage', '.0f', ' mg/dL')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CGM metrics (TIR/TAR/TBR, CV, GMI, AUC, MAGE) per day, bucket and period')
+    parser.add_argument('csv_files', nargs='+')
+    parser.add_argument('--start', help='start date (default: first reading)')
+    parser.add_argument('--end', help='end date (default: last reading)')
+    parser.add_argument('-o', '--output', default='cgm_metrics.csv', help='long table with one row per file, level and key')
+    args = parser.parse_args(argv)
+
+    tables = []
+    for csv_file in args.csv_files:
+        series = load_glucose_csv(csv_file, compact=True)
+        if len(series):
+            times = series['time']
+            series = time_range(series, args.start or times[0], args.end or times[-1])
+        table = metrics_table(cgm_metrics(series))
+        table.insert(0, 'file', os.path.basename(csv_file))
+        tables.append(table)
+        period = table.iloc[0]
+        print(f"{csv_file}: {period['count']} readings, {period['hours']:.1f} h, "
+              f"{format_metrics(period).replace(chr(10), ', ')}")
+    pd.concat(tables, ignore_index=True).to_csv(args.output, index=False)
+    print(f'written {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
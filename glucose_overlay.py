@@ -0,0 +1,204 @@
+import numpy as np
+import matplotlib.dates as mdates
+import matplotlib.patheffects as PathEffects
+from matplotlib.collections import LineCollection
+from datetime import datetime, timedelta
+
+# 重ね描きの基準日としきい値（各スクリプトと同じ値）
+BASE_DATE = datetime(1900, 1, 1)
+TIME_THRESHOLD = timedelta(minutes=30)
+
+# 平滑化の種類（smooth_segment を参照）
+SMOOTH_MODES = (None, 'linear', 'cubic', 'monotone')
+
+# 日付ごとの線の色
+COLORS = [
+    '#000000', # 黒
+    '#FFFF00', # 黄
+    '#0000FF', # 青
+    '#FF0000', # 赤
+    '#87CEFA', # ライトスカイブルー
+    '#FFD700', # ゴールド
+    '#808080', # 灰色
+    '#20B2AA', # ライトシーグリーン
+    '#FF1493', # 濃いピンク
+    '#000080', # ネイビー
+    '#FFA500', # オレンジ
+    '#00FFFF', # シアン
+    '#C71585', # ミディアムバイオレットレッド
+    '#800080', # 紫
+    '#D2691E', # チョコレート色
+    '#FF00FF', # マゼンタ
+    '#C0C0C0', # シルバー
+    '#2E8B57', # シーグリーン
+    '#FF6347', # トマト色
+    '#BA55D3', # ミディアムオーキッド
+    '#FF4500', # オレンジレッド
+    '#8A2BE2', # ブルーバイオレット
+    '#008000', # 緑
+    '#8B4513', # サドルブラウン
+    '#32CD32', # ライムグリーン
+    '#40E0D0', # ターコイズ
+    '#5F9EA0', # ケイデットブルー
+    '#008080', # ティール
+    '#DA70D6', # オーキッド
+    '#228B22', # フォレストグリーン
+    '#A0522D', # シエナ
+    '#CD5C5C', # インディアンレッド
+    '#FFC0CB', # ピンク
+    '#FA8072', # サーモン
+    '#B0C4DE', # ライトスチールブルー
+    '#ADD8E6', # ライトブルー
+    '#DEB887', # バーリウッド
+    '#F5DEB3', # ホウィート
+    '#FFFACD', # レモンシフォン
+    '#E0FFFF' # ライトシアン
+]
+
+
+# 全日分の時刻・グルコース値を日付ごと・30分以上の欠測ごとのセグメントに一括分割する
+# smooth が None なら測定点をそのまま結び、'linear' / 'cubic' / 'monotone' のときだけ
+# points_per_segment 点に再サンプリングする（smooth_segment を参照）
+# 戻り値: (segments, segment_days)
+#   segments     : 各セグメントの (N, 2) 配列 [x (基準日の mdates 数値), glucose] のリスト
+#   segment_days : 各セグメントの日付 (datetime.date) のリスト
+def split_daily_segments(times, glucose, time_threshold=TIME_THRESHOLD, base_date=BASE_DATE,
+                         smooth=None, points_per_segment=300):
+    check_smooth(smooth)
+    t = np.asarray(times, dtype='datetime64[ns]')
+    g = np.asarray(glucose, dtype=float)
+    if len(t) == 0:
+        return [], []
+
+    # 時刻順に並べ替え
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    g = g[order]
+
+    # 日付と時刻（1日の中の経過時間）に分解し、基準日の時刻に付け替える
+    day = t.astype('datetime64[D]')
+    x = mdates.date2num(base_date) + (t - day) / np.timedelta64(1, 'D')
+
+    # 日付が変わる点、またはしきい値を超える欠測がある点でセグメントを区切る
+    threshold = np.timedelta64(int(time_threshold / timedelta(microseconds=1)), 'us')
+    new_segment = np.empty(len(t), dtype=bool)
+    new_segment[0] = True
+    new_segment[1:] = (day[1:] != day[:-1]) | ((t[1:] - t[:-1]) > threshold)
+    segment_id = np.cumsum(new_segment) - 1
+
+    # 重複するx値の処理（同一セグメント内の同時刻は平均値にまとめる）
+    new_point = new_segment.copy()
+    new_point[1:] |= t[1:] != t[:-1]
+    point_id = np.cumsum(new_point) - 1
+    counts = np.bincount(point_id)
+    x = x[new_point]
+    g = np.bincount(point_id, weights=g) / counts
+    segment_id = segment_id[new_point]
+    day = day[new_point]
+
+    # セグメント境界で分割（点が2つ未満のセグメントは描画しない）
+    starts = np.flatnonzero(np.r_[True, segment_id[1:] != segment_id[:-1]])
+    ends = np.r_[starts[1:], len(segment_id)]
+    keep = (ends - starts) >= 2
+
+    segments = []
+    for s, e in zip(starts[keep], ends[keep]):
+        seg_x, seg_y = smooth_segment(x[s:e], g[s:e], smooth, points_per_segment)
+        segments.append(np.column_stack((seg_x, seg_y)))
+    segment_days = list(day[starts[keep]].astype(object))
+    return segments, segment_days
+
+
+# 平滑化の種類を確認する（データの点の数によらず、知らない種類は ValueError）
+def check_smooth(smooth):
+    if smooth not in SMOOTH_MODES:
+        raise ValueError(f"Unknown smoothing mode: {smooth!r} (expected one of {', '.join(map(repr, SMOOTH_MODES))})")
+
+
+# 1本のセグメントを平滑化する（x は昇順・重複なしであること）
+#   None      : 測定点をそのまま返す（折れ線 = 線形スプライン k=1 と同じ見た目）
+#   'linear'  : 折れ線上を points 点で等間隔に再サンプリング（従来の make_interp_spline(k=1) 相当）
+#   'cubic'   : 3次スプライン（点が4つ未満のときは測定点のまま）
+#   'monotone': 単調性を保つ PCHIP 補間（オーバーシュートしない）
+def smooth_segment(x, y, smooth=None, points=300):
+    check_smooth(smooth)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if smooth is None or len(x) < 2:
+        return x, y
+    x_new = np.linspace(x[0], x[-1], points)
+    if smooth == 'linear':
+        return x_new, np.interp(x_new, x, y)
+    if smooth == 'cubic':
+        if len(x) < 4:
+            return x, y
+        from scipy.interpolate import make_interp_spline
+        return x_new, make_interp_spline(x, y, k=3)(x_new)
+    from scipy.interpolate import PchipInterpolator  # 'monotone'
+    return x_new, PchipInterpolator(x, y)(x_new)
+
+
+# 表示範囲を columns 列に分け、列ごとに最初・最後・最小・最大の点だけを残す（M4 間引き）
+# 1列に 4 点以下しか残らないので点の数は列数の 4 倍以下になり、ピーク（最大・最小）は正確に残る
+# group を渡すと group の値（セグメントの番号など）ごとに別の列として扱う。x は group ごとに昇順であること
+# 欠測（NaN）の点は線の切れ目として残す
+# 戻り値: 残す点の位置（昇順）
+def decimate_indices(x, y, x_range, columns, group=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    columns = int(columns)
+    if columns <= 0 or (group is None and n <= 4 * columns):
+        return np.arange(n)
+
+    # 列の番号（表示範囲の外の点は前後それぞれ1つの列にまとめる）
+    x0, x1 = x_range
+    col = np.clip(np.floor((x - x0) / (x1 - x0) * columns), -1, columns).astype(np.int64)
+    if group is not None:
+        col = np.asarray(group, dtype=np.int64) * (columns + 2) + col
+    starts = np.flatnonzero(np.r_[True, col[1:] != col[:-1]])
+    if len(starts) * 4 >= n:   # 平均で1列に 4 点以下なら間引いても減らない
+        return np.arange(n)
+    ends = np.r_[starts[1:], n]
+    bins = np.repeat(np.arange(len(starts)), ends - starts)
+
+    finite = np.isfinite(y)
+    keep = ~finite
+    keep[starts] = True
+    keep[ends - 1] = True
+    for values, reduce in ((np.where(finite, y, np.inf), np.minimum), (np.where(finite, y, -np.inf), np.maximum)):
+        # 各列で最小（最大）になる最初の点
+        hit = np.flatnonzero(values == reduce.reduceat(values, starts)[bins])
+        keep[hit[np.r_[True, bins[hit][1:] != bins[hit][:-1]]]] = True
+    return np.flatnonzero(keep)
+
+
+# x, y を間引く（decimate_indices を参照）
+def decimate(x, y, x_range, columns):
+    idx = decimate_indices(x, y, x_range, columns)
+    if len(idx) == len(x):
+        return np.asarray(x), np.asarray(y)
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+
+
+# (N, 2) のセグメントのリストを、セグメントごとに columns 列で間引く（全セグメントを一括で処理する）
+def decimate_segments(segments, x_range, columns):
+    if not len(segments):
+        return list(segments)
+    lengths = np.array([len(seg) for seg in segments])
+    points = np.concatenate(segments)
+    group = np.repeat(np.arange(len(segments)), lengths)
+    idx = decimate_indices(points[:, 0], points[:, 1], x_range, columns, group)
+    if len(idx) == len(points):
+        return list(segments)
+    offsets = np.searchsorted(idx, np.r_[0, np.cumsum(lengths)])
+    return np.split(points[idx], offsets[1:-1])
+
+
+# 全セグメントを LineCollection として1回で描画する（影のようなエフェクト付き）
+def draw_daily_overlay(ax, segments, segment_colors, linewidth=4, stroke_width=5, stroke_color='black'):
+    collection = LineCollection(segments, colors=segment_colors, linewidths=linewidth)
+    if stroke_width:
+        collection.set_path_effects([PathEffects.withStroke(linewidth=stroke_width, foreground=stroke_color)])
+    ax.add_collection(collection)
+    return collection
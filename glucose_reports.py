@@ -0,0 +1,486 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from glucose_io import load_glucose_csv, time_range, day_numbers, day_dates
+from glucose_archive import open_archive
+from glucose_overlay import BASE_DATE, TIME_THRESHOLD, COLORS, split_daily_segments
+from glucose_events import read_events, normalize_events, event_bounds, event_curves
+from glucose_stats import DAY_NIGHT_BINS, bucket_stats, stream_bucket_stats, bucket_table
+from glucose_store import update_from_csv, store_stats, patient_name
+from glucose_metrics import cgm_metrics as _cgm_metrics, format_metrics
+from glucose_grid import DayGrid, GRID_MINUTES
+from report_figures import get_template, OverlayFigure, AgpFigure, DayNightFigure, RaceFigure
+from report_images import image_options as _image_options, render_figure
+from report_deck import DeckBuilder, picture_size
+from report_metrics import RunMetrics
+from report_cache import ResultCache, content_key, series_key
+
+# 日ごとの重ね描きの種類（'daily': 日ごとに1本の線 / 'agp': 時刻ごとの中央値とパーセンタイルの帯）
+OVERLAY_MODES = ('daily', 'agp')
+AGP_PERCENTILES = (5, 25, 50, 75, 95)
+
+# フォント設定（レポートごとに font.size が異なる）
+FONT_RC = {'font.family': 'Helvetica', 'font.weight': 'bold'}
+
+
+# 出力ファイルの基本名（out_dir を指定しない場合は従来どおり CSV と同じ場所）
+def _base_name(csv_file, out_dir):
+    if out_dir:
+        return os.path.join(out_dir, os.path.splitext(os.path.basename(csv_file))[0])
+    return os.path.splitext(csv_file)[0]
+
+
+# 測定値を読み込む。archive（アーカイブのフォルダ）を指定した場合は患者のアーカイブをメモリマップで開き、CSV は解析しない
+def _load(csv_file, compact, archive, metrics):
+    with metrics.stage('load', archive=bool(archive)) as counts:
+        df = open_archive(patient_name(csv_file), archive).series() if archive else load_glucose_csv(csv_file, compact=compact)
+        counts['rows'] = len(df)
+    return df
+
+
+# 期間のテキスト用の日付。指定どおりの日付の文字列はそのまま、時刻を含むもの（例: 月末の 23:59:59）は日付だけにする
+def _date_text(value):
+    ts = pd.Timestamp(value)
+    return value if isinstance(value, str) and ts == ts.normalize() else ts.strftime('%Y-%m-%d')
+
+
+# 結果のキャッシュ（ResultCache またはフォルダ。None なら環境変数 GLUCOSE_RESULT_CACHE の設定、未設定ならキャッシュしない）
+# False なら環境変数の設定によらずキャッシュしない
+def _result_cache(cache):
+    if cache is False:
+        return None
+    if cache is None:
+        return ResultCache.from_env()
+    if isinstance(cache, (str, os.PathLike)):
+        return ResultCache(cache)
+    if not isinstance(cache, ResultCache):
+        raise TypeError(f'cache must be a ResultCache, a directory, None or False, not {type(cache).__name__}')
+    return cache
+
+
+# 期間の測定値の内容のキー（キャッシュしない場合は None）
+def _data_key(df, cache, metrics):
+    if cache is None:
+        return None
+    with metrics.stage('cache_key', rows=len(df)):
+        return series_key(df)
+
+
+# キャッシュにある結果を使う（無ければ compute() の結果をキャッシュに入れる）。cache が None なら常に compute() する
+# parts はキーの材料（測定値のキー・グラフの設定など）
+def _cached(cache, parts, metrics, stage, compute):
+    if cache is None:
+        return compute()
+    key = content_key(stage, parts)
+    with metrics.stage(f'{stage}_cache') as counts:
+        value = cache.get(key)
+        counts['hit'] = value is not None
+    if value is None:
+        value = compute()
+        cache.put(key, value)
+    return value
+
+
+# _cached の画像版。キャッシュの画像は render_figure と同じ形（ファイルまたはメモリ上のバッファ）で返す
+def _cached_image(cache, parts, path, options, metrics, stage, render):
+    if cache is None:
+        return render()
+    with metrics.stage(f'{stage}_cache') as counts:
+        image = cache.load_image((stage, parts), path, options)
+        counts['hit'] = image is not None
+    if image is None:
+        image = render()
+        cache.store_image((stage, parts), image, options)
+    return image
+
+
+# 計測の記録に加えるキャッシュのヒット・ミスの件数
+def _cache_info(cache):
+    return {'cache': dict(cache.counts)} if cache is not None else {}
+
+
+# スライドに画像とテキストを入れる。deck を指定した場合は資料にスライドを1枚追加し、
+# 指定しない場合はテンプレートの最初のスライドに入れて output に保存する
+# 戻り値: (出力ファイル, サイズと処理時間の報告（deck を指定した場合は None）)
+def _write_slide(layout, template, output, deck, pictures, texts, metrics):
+    if deck is not None:
+        with metrics.stage('pptx_fill', slides=1):
+            deck.add_slide(layout, pictures, texts)
+        return deck.output, None
+    with metrics.stage('pptx_fill', slides=1):
+        deck = DeckBuilder(template, output)
+        deck.add_slide(layout, pictures, texts)
+    with metrics.stage('pptx_save') as counts:
+        output = deck.save()
+        counts['bytes'] = os.path.getsize(output)
+    return output, deck.report()
+
+
+# 測定値を resample 分間隔の日 × 時刻の格子に載せる（resample が None なら格子を使わない）
+def _grid(df, resample, metrics):
+    if not resample:
+        return None
+    with metrics.stage('grid', rows=len(df), minutes=resample) as counts:
+        grid = DayGrid.from_series(df, resample)
+        counts['days'] = len(grid)
+    return grid
+
+
+# 0-6時と6-24時の統計（格子があれば格子の列の範囲で集計する）
+def _day_night_stats(df, grid, metrics, cache=None, data_key=None, resample=None):
+    def compute():
+        with metrics.stage('day_night_stats'):
+            return grid.bucket_stats(DAY_NIGHT_BINS) if grid is not None else bucket_stats(df, DAY_NIGHT_BINS)
+    return _cached(cache, (data_key, DAY_NIGHT_BINS, resample), metrics, 'day_night_stats', compute)
+
+
+# CGM 指標（TIR・CV・GMI・MAGE など）を求め、テキストボックスに追記する行を作る
+def _metrics_text(df, metrics, cache=None, data_key=None):
+    def compute():
+        with metrics.stage('cgm_metrics', rows=len(df)):
+            return _cgm_metrics(df)
+    tables = _cached(cache, (data_key,), metrics, 'cgm_metrics', compute)
+    return tables, '\n' + format_metrics(tables['period'].iloc[0])
+
+
+# 0-6時 / 6-24時のエラーバーのテンプレートに bucket_stats の結果を入れる
+def _day_night_figure(daily, period, ylim, legend):
+    labels = [b[0] for b in DAY_NIGHT_BINS]
+    figure = get_template(DayNightFigure, ylim=ylim, labels=tuple(labels), legend=legend)
+    figure.update([bucket_table(daily, label) for label in labels], [period.loc[label, 'mean'] for label in labels])
+    return figure
+
+
+# 日ごとの重ね描きグラフを作成して {base_name}-1.png に保存する（in_memory ならメモリ上のバッファを返す）
+# grid を渡すと、日ごとの線は格子の行から作る
+def _daily_overlay_figure(filtered_df, start_date, end_date, base_name, ylim, legend_size, smooth, options, metrics,
+                          slide_size=None, grid=None):
+    colors = COLORS
+
+    # 期間の最初の日からの日数で色を決める（日番号の整数で計算し、date オブジェクトは凡例だけに使う）
+    # 日数が色の数より多い場合は色を繰り返して使う（凡例は複数列になる）
+    first, last = day_numbers(np.array([pd.Timestamp(start_date), pd.Timestamp(end_date)], dtype='datetime64[ns]'))
+    days = np.unique(day_numbers(filtered_df['time']))
+
+    # 確認：全ての日付が期間に含まれていることを確認
+    assert ((days >= first) & (days <= last)).all(), "Not all dates are in the date range."
+
+    # 日付ごとのセグメントを一括で作成（30分以上の欠測で分割）
+    with metrics.stage('segments', rows=len(filtered_df)) as counts:
+        if grid is not None:
+            segments, segment_days = grid.overlay_segments(BASE_DATE)
+        else:
+            segments, segment_days = split_daily_segments(filtered_df['time'], filtered_df['glucose'], TIME_THRESHOLD, BASE_DATE, smooth=smooth)
+        counts['segments'] = len(segments)
+        counts['vertices'] = int(sum(len(s) for s in segments))
+
+    # 凡例用のラベルと色を辞書に保存
+    legend_labels = {}
+    for day, date in zip(days, day_dates(days)):
+        legend_labels[date.strftime('%Y-%m-%d')] = colors[(day - first) % len(colors)]
+
+    # 作成済みの図にセグメントと凡例を入れて保存
+    segment_colors = [colors[(day - first) % len(colors)] for day in day_numbers(np.array(segment_days, dtype='datetime64[D]'))]
+    with metrics.stage('overlay_render', days=len(legend_labels)) as counts:
+        figure = get_template(OverlayFigure, ylim=ylim, legend_size=legend_size)
+        figure.update(segments, segment_colors, legend_labels)
+        image = render_figure(figure.save, f'{base_name}-1.png', options, figure.fig, slide_size)
+        counts['bytes'] = image.stats['bytes']
+    return image
+
+
+# 時刻ごとの中央値・25-75% / 5-95% の帯のグラフを作成して {base_name}-1.png に保存する
+# 格子（grid）の列方向の集計なので、日数が増えても描画の量は変わらない。highlight_days の日だけ線で重ねる
+def _agp_figure(grid, base_name, ylim, legend_size, highlight_days, options, metrics, slide_size=None):
+    with metrics.stage('agp_percentiles', days=len(grid), slots=grid.slots):
+        percentiles = grid.percentiles(AGP_PERCENTILES)
+        x = mdates.date2num(BASE_DATE) + grid.slot_hours() / 24
+
+    # 選んだ日の線（格子の行から作る）。期間外・測定値の無い日は線も凡例も出さず、警告を表示する
+    segments, segment_colors, legend_labels, skipped = [], [], {}, []
+    for day in pd.to_datetime(list(highlight_days or ())):
+        day_segments, _ = grid.day_range(day, day).overlay_segments(BASE_DATE)
+        if not day_segments:
+            skipped.append(day.strftime('%Y-%m-%d'))
+            continue
+        color = COLORS[len(legend_labels) % len(COLORS)]
+        segments += day_segments
+        segment_colors += [color] * len(day_segments)
+        legend_labels[day.strftime('%Y-%m-%d')] = color
+    if skipped:
+        print(f"Warning: no readings to highlight on {', '.join(skipped)} (outside the selected range or no data)",
+              file=sys.stderr)
+
+    with metrics.stage('overlay_render', days=len(grid), highlights=len(legend_labels)) as counts:
+        figure = get_template(AgpFigure, ylim=ylim, legend_size=legend_size)
+        figure.update(x, percentiles, len(grid), segments, segment_colors, legend_labels)
+        image = render_figure(figure.save, f'{base_name}-1.png', options, figure.fig, slide_size)
+        counts['bytes'] = image.stats['bytes']
+    return image
+
+
+# 重ね描きグラフ（overlay の種類に応じて日ごとの線または AGP）
+def _overlay_image(overlay, filtered_df, start_date, end_date, base_name, ylim, legend_size, smooth, options, metrics,
+                   slide_size, grid, highlight_days, resample, cache=None, data_key=None):
+    if overlay not in OVERLAY_MODES:
+        raise ValueError(f'Unknown overlay mode: {overlay!r} (expected one of {", ".join(OVERLAY_MODES)})')
+
+    def render():
+        if overlay == 'agp':
+            agp_grid = grid if grid is not None else _grid(filtered_df, resample or GRID_MINUTES, metrics)
+            return _agp_figure(agp_grid, base_name, ylim, legend_size, highlight_days, options, metrics, slide_size)
+        return _daily_overlay_figure(filtered_df, start_date, end_date, base_name, ylim, legend_size, smooth, options, metrics,
+                                     slide_size, grid)
+    parts = (data_key, overlay, pd.Timestamp(start_date), pd.Timestamp(end_date), ylim, legend_size, smooth, slide_size,
+             resample, [str(d) for d in highlight_days or ()], COLORS)
+    return _cached_image(cache, parts, f'{base_name}-1.png', options, metrics, 'overlay', render)
+
+
+# 妊活 月の平均値レポート（0-6時 / 6-24時の日別エラーバー、横向きスライド）
+def monthly_report(csv_file, start_date, end_date,
+                   template='presentation_a4_background_yoko.pptx', output='updated_presentation_yoko.pptx',
+                   out_dir=None, streaming=False, chunksize=200_000, store_dir=None, image_options=None, deck=None, show=False,
+                   metrics=None, compact=False, cgm_metrics=False, resample=None, archive=None, cache=None):
+    options = _image_options(image_options)
+    metrics = metrics if metrics is not None else RunMetrics()
+    cache = _result_cache(cache)
+    if cgm_metrics and (store_dir or streaming):
+        raise ValueError('cgm_metrics needs the readings and cannot be combined with store_dir or streaming')
+    if archive and (store_dir or streaming):
+        raise ValueError('archive cannot be combined with store_dir or streaming')
+    tables, extra = None, ''
+    with plt.rc_context({**FONT_RC, 'font.size': 18}):
+        base_name = _base_name(csv_file, out_dir)
+
+        # 0-6時と6-24時の統計
+        if store_dir:
+            # 患者ごとの日別集計ストアを更新し（新しい日・変わった日だけ再集計）、期間の統計を取り出す
+            with metrics.stage('store_update'):
+                _, store, _ = update_from_csv(csv_file, store_dir, DAY_NIGHT_BINS)
+            with metrics.stage('day_night_stats'):
+                daily, period = store_stats(store, start_date, end_date)
+        elif streaming:
+            with metrics.stage('stream_stats', chunksize=chunksize):
+                daily, period = stream_bucket_stats(csv_file, start_date, end_date, DAY_NIGHT_BINS, chunksize)
+        else:
+            # CSVファイルの読み込み（解析済みのキャッシュがあれば使用）
+            df = _load(csv_file, compact, archive, metrics)
+            with metrics.stage('filter') as counts:
+                filtered_df = time_range(df, start_date, end_date)
+                counts['rows'] = len(filtered_df)
+            data_key = _data_key(filtered_df, cache, metrics)
+            daily, period = _day_night_stats(filtered_df, _grid(filtered_df, resample, metrics), metrics,
+                                             cache, data_key, resample)
+            if cgm_metrics:
+                tables, extra = _metrics_text(filtered_df, metrics, cache, data_key)
+        morning_avg, daytime_avg = period['mean']
+
+        # グラフ2の保存（背景を透明にし、凡例を表示せず）
+        def render_graph():
+            with metrics.stage('graph_render', days=daily['Date'].nunique()) as counts:
+                figure = _day_night_figure(daily, period, ylim=(40, 140), legend=False)
+                image = render_figure(figure.save, f'{base_name}-2.png', options, figure.fig, picture_size('monthly', 'graph'))
+                counts['bytes'] = image.stats['bytes']
+            return image
+        graph_image = _cached_image(cache, (daily, period, (40, 140), False, picture_size('monthly', 'graph')),
+                                    f'{base_name}-2.png', options, metrics, 'graph', render_graph)
+
+        # 凡例を別に保存
+        def render_legend():
+            with metrics.stage('legend_render') as counts:
+                figure = _day_night_figure(daily, period, ylim=(40, 140), legend=False)
+                image = render_figure(lambda target, **kw: figure.legend_figure().savefig(target, transparent=True, **kw),
+                                      f'{base_name}-legend.png', options)
+                counts['bytes'] = image.stats['bytes']
+            return image
+        legend_image = _cached_image(cache, DAY_NIGHT_BINS, f'{base_name}-legend.png', options, metrics, 'legend', render_legend)
+
+        # グラフを表示
+        if show:
+            plt.show()
+
+    # PowerPointファイルにグラフ、凡例、平均値テキスト、測定期間テキストを挿入して保存
+    output, size_report = _write_slide('monthly', template, output, deck,
+                          {'graph': graph_image, 'legend': legend_image},
+                          {'averages': f"Average 0-6 h: {morning_avg:.1f} mg/dL\nAverage 6-24 h: {daytime_avg:.1f} mg/dL{extra}",
+                           'period': f"{_date_text(start_date)} 〜 {_date_text(end_date)}"}, metrics)
+    record = metrics.finish(report='monthly', csv_file=csv_file, output=output, **_cache_info(cache))
+    return {'output': output, 'morning_avg': morning_avg, 'daytime_avg': daytime_avg, 'daily': daily, 'period': period,
+            'cgm_metrics': tables, 'size_report': size_report, 'metrics': record}
+
+
+# グルコースファイルと平均値レポート（日ごとの重ね描き + 0-6時 / 6-24時のエラーバー）
+def glucose_file_report(csv_file, start_date, end_date,
+                        template='presentation_a4_background-2.pptx', output='updated_presentation-2.pptx',
+                        out_dir=None, smooth=None, image_options=None, deck=None, show=False, metrics=None, compact=False,
+                        cgm_metrics=False, resample=None, overlay='daily', highlight_days=None, archive=None, cache=None):
+    options = _image_options(image_options)
+    metrics = metrics if metrics is not None else RunMetrics()
+    cache = _result_cache(cache)
+    tables, extra = None, ''
+    start_date = pd.to_datetime(start_date)
+    end_date = pd.to_datetime(end_date)
+    with plt.rc_context({**FONT_RC, 'font.size': 24}):
+        # CSVファイルの読み込み（解析済みのキャッシュがあれば使用）
+        df = _load(csv_file, compact, archive, metrics)
+        base_name = _base_name(csv_file, out_dir)
+
+        # フィルタリング
+        with metrics.stage('filter') as counts:
+            filtered_df = time_range(df, start_date, end_date)
+            counts['rows'] = len(filtered_df)
+
+        data_key = _data_key(filtered_df, cache, metrics)
+        grid = _grid(filtered_df, resample, metrics)
+        overlay_image = _overlay_image(overlay, filtered_df, start_date, end_date, base_name,
+                                       ylim=(50, 200), legend_size=18, smooth=smooth, options=options, metrics=metrics,
+                                       slide_size=picture_size('glucose', 'overlay'), grid=grid,
+                                       highlight_days=highlight_days, resample=resample, cache=cache, data_key=data_key)
+
+        # 0-6時と6-24時の統計
+        daily, period = _day_night_stats(filtered_df, grid, metrics, cache, data_key, resample)
+        morning_avg, daytime_avg = period['mean']
+        if cgm_metrics:
+            tables, extra = _metrics_text(filtered_df, metrics, cache, data_key)
+
+        # 凡例を含めてグラフ2を保存
+        def render_graph():
+            with metrics.stage('graph_render', days=daily['Date'].nunique()) as counts:
+                figure = _day_night_figure(daily, period, ylim=(50, 160), legend=True)
+                image = render_figure(lambda target, **kw: figure.save(target, bbox_inches='tight', **kw), f'{base_name}-2.png',
+                                      options, figure.fig, picture_size('glucose', 'graph'))
+                counts['bytes'] = image.stats['bytes']
+            return image
+        graph_image = _cached_image(cache, (daily, period, (50, 160), True, picture_size('glucose', 'graph')),
+                                    f'{base_name}-2.png', options, metrics, 'graph', render_graph)
+
+        # グラフを表示
+        if show:
+            plt.show()
+
+    # PowerPointファイルにグラフ1・2、平均値、測定期間、ファイル名のテキストを挿入して保存
+    output, size_report = _write_slide('glucose', template, output, deck,
+                          {'overlay': overlay_image, 'graph': graph_image},
+                          {'averages': f"0-6時の平均値: {morning_avg:.1f} mg/dL\n6-24時の平均値: {daytime_avg:.1f} mg/dL{extra}",
+                           'period': f"{start_date.strftime('%Y-%m-%d')} 〜 {end_date.strftime('%Y-%m-%d')}",
+                           'name': os.path.splitext(os.path.basename(csv_file))[0]}, metrics)
+    record = metrics.finish(report='glucose', csv_file=csv_file, output=output, **_cache_info(cache))
+    return {'output': output, 'morning_avg': morning_avg, 'daytime_avg': daytime_avg, 'daily': daily, 'period': period,
+            'cgm_metrics': tables, 'size_report': size_report, 'metrics': record}
+
+
+# 試合（レース）レポート（日ごとの重ね描き + 試合前 / 試合中の区間グラフ）
+# 1つの試合は time_start / time_mid / time_end で、複数の試合は events（イベントファイルのパスまたは
+# {'time_start', 'time_mid', 'time_end', 'label'} のリスト）で指定する。試合ごとにグラフとスライドを1枚作る
+def race_report(csv_file, start_date, end_date, time_start=None, time_mid=None, time_end=None,
+                template='presentation_a4_background-3.pptx', output='updated_presentation-3.pptx',
+                out_dir=None, smooth=None, image_options=None, deck=None, show=False, events=None, metrics=None,
+                compact=False, cgm_metrics=False, resample=None, overlay='daily', highlight_days=None, archive=None,
+                cache=None):
+    options = _image_options(image_options)
+    metrics = metrics if metrics is not None else RunMetrics()
+    cache = _result_cache(cache)
+    tables, extra = None, ''
+    start_date = pd.to_datetime(start_date)
+    end_date = pd.to_datetime(end_date)
+    if events is None:
+        if time_start is None or time_mid is None or time_end is None:
+            raise ValueError('race_report needs time_start, time_mid and time_end, or events')
+        events = normalize_events([{'time_start': time_start, 'time_mid': time_mid, 'time_end': time_end}])
+    elif isinstance(events, (str, os.PathLike)):
+        events = read_events(events)
+    else:
+        events = normalize_events(events)
+    if not events:
+        raise ValueError('No events to report')
+
+    with plt.rc_context({**FONT_RC, 'font.size': 24}):
+        # CSVファイルの読み込み（解析済みのキャッシュがあれば使用）
+        df = _load(csv_file, compact, archive, metrics)
+        base_name = _base_name(csv_file, out_dir)
+
+        # 日ごとの重ね描きグラフは全試合で共通
+        with metrics.stage('filter') as counts:
+            filtered_df = time_range(df, start_date, end_date)
+            counts['rows'] = len(filtered_df)
+        data_key = _data_key(filtered_df, cache, metrics)
+        overlay_image = _overlay_image(overlay, filtered_df, start_date, end_date, base_name,
+                                       ylim=(60, 280), legend_size=24, smooth=smooth, options=options, metrics=metrics,
+                                       slide_size=picture_size('race', 'overlay'), grid=_grid(filtered_df, resample, metrics),
+                                       highlight_days=highlight_days, resample=resample, cache=cache, data_key=data_key)
+        if cgm_metrics:
+            tables, extra = _metrics_text(filtered_df, metrics, cache, data_key)
+
+        # 時刻順の配列で、各試合の区間の位置を二分探索で求める（試合の期間の行だけを数値にする）
+        with metrics.stage('race_windows', events=len(events)) as counts:
+            df = time_range(df, min(e['time_start'] for e in events), max(e['time_end'] for e in events))
+            counts['rows'] = len(df)
+            times = np.asarray(df['time'], dtype='datetime64[ns]')
+            x = mdates.date2num(times)
+            g = np.asarray(df['glucose'], dtype=float)
+            bounds = event_bounds(times, events)
+            curves = [event_curves(x, g, event_bound, event['time_mid'], smooth, 100) for event, event_bound in zip(events, bounds)]
+
+        # 試合ごとにグラフを作る
+        figure = get_template(RaceFigure, ylim=(60, 280))
+        results = []
+        for i, (event, result) in enumerate(zip(events, curves)):
+            suffix = '' if len(events) == 1 else f'-{i + 1}'
+
+            def render_race():
+                with metrics.stage('race_render') as counts:
+                    figure.update(result['blue_curve'], result['red_curve'], result['blue_points'], result['red_points'],
+                                  (event['time_start'], event['time_end']))
+                    image = render_figure(figure.save, f'{base_name}-race{suffix}.png', options, figure.fig, picture_size('race', 'graph'))
+                    counts['bytes'] = image.stats['bytes']
+                return image
+            parts = ([result[key] for key in ('blue_curve', 'red_curve', 'blue_points', 'red_points')],
+                     event['time_start'], event['time_end'], (60, 280), picture_size('race', 'graph'))
+            result['image'] = _cached_image(cache, parts, f'{base_name}-race{suffix}.png', options, metrics, 'race', render_race)
+            if not event['label'] and len(events) > 1:
+                event = dict(event, label=f'#{i + 1}')
+            results.append(dict(result, **event))
+
+        if show:
+            plt.show()
+
+    # 試合ごとに1枚のスライドを作る（deck を指定しない場合は1つの資料にまとめて保存）
+    own_deck = deck is None
+    name = os.path.splitext(os.path.basename(csv_file))[0]
+    period = f"{start_date.strftime('%Y-%m-%d')} 〜 {end_date.strftime('%Y-%m-%d')}"
+    with metrics.stage('pptx_fill', slides=len(results)):
+        if own_deck:
+            deck = DeckBuilder(template, output)
+        for result in results:
+            # PowerPointファイルにグラフ1・2、平均値、測定期間、ファイル名のテキストを挿入
+            deck.add_slide('race', {'overlay': overlay_image, 'graph': result.pop('image')},
+                           {'averages': f"試合前: Ave. {result['avg_before']:.1f} mg/dL, Max {result['max_before']:.1f} mg/dL\n"
+                                        f"試合中: Ave. {result['avg_during']:.1f} mg/dL, Max {result['max_during']:.1f} mg/dL{extra}",
+                            'period': period,
+                            'name': f"{name} {result['label']}".rstrip()})
+    if own_deck:
+        with metrics.stage('pptx_save') as counts:
+            output = deck.save()
+            counts['bytes'] = os.path.getsize(output)
+    else:
+        output = deck.output
+    size_report = deck.report() if own_deck else None
+    record = metrics.finish(report='race', csv_file=csv_file, output=output, **_cache_info(cache))
+
+    summary = [{key: r[key] for key in ('label', 'time_start', 'time_mid', 'time_end',
+                                        'avg_before', 'max_before', 'avg_during', 'max_during')} for r in results]
+    if len(summary) == 1:
+        return {'output': output, **{key: summary[0][key] for key in ('avg_before', 'max_before', 'avg_during', 'max_during')},
+                'events': summary, 'cgm_metrics': tables, 'size_report': size_report, 'metrics': record}
+    return {'output': output, 'events': summary, 'cgm_metrics': tables, 'size_report': size_report, 'metrics': record}
+
+
+# レポートの種類名と関数の対応（バッチ処理・マニフェストで使用）
+REPORTS = {
+    'monthly': monthly_report,
+    'glucose': glucose_file_report,
+    'race': race_report,
+}
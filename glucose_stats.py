@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from glucose_io import time_values, day_numbers, day_dates
+
+# 時間帯の区分（ラベル, 開始時, 終了時）。開始 <= 時刻 < 終了 の測定値をその区分に割り当てる
+# 時刻は小数でも指定できる（例: 5.5 = 5時30分）。区分どうしは重ならないこと
+DAY_NIGHT_BINS = [('0-6 h', 0, 6), ('6-24 h', 6, 24)]
+
+# 区分ごとに出力する統計量
+STAT_COLUMNS = ['mean', 'std', 'count', 'min', 'max']
+
+# 分散計算の桁落ちを防ぐため、平方和はこの値を引いてから積算する
+_SHIFT = 100.0
+
+
+# 区分の妥当性を確認し、開始時刻順に並べる
+def check_bins(bins):
+    bins = sorted(((str(label), float(start), float(end)) for label, start, end in bins), key=lambda b: b[1])
+    for label, start, end in bins:
+        if not 0 <= start < end <= 24:
+            raise ValueError(f'Invalid time-of-day bin {label!r}: {start}-{end}')
+    for (label_a, _, end_a), (label_b, start_b, _) in zip(bins, bins[1:]):
+        if start_b < end_a:
+            raise ValueError(f'Time-of-day bins {label_a!r} and {label_b!r} overlap')
+    return bins
+
+
+# 各測定値がどの区分に入るかを一括で求める（どの区分にも入らない場合は -1）
+def tag_buckets(times, bins):
+    t = time_values(times)
+    hours = (t - t.astype('datetime64[D]')) / np.timedelta64(1, 'h')
+    starts = np.array([b[1] for b in bins])
+    ends = np.array([b[2] for b in bins])
+    idx = np.searchsorted(starts, hours, side='right') - 1
+    inside = (idx >= 0) & (hours < ends[np.clip(idx, 0, None)])
+    return np.where(inside, idx, -1)
+
+
+# 時間帯区分ごとの日別統計と期間全体の統計を1回の集計で求める
+# df は DataFrame または GlucoseSeries。日ごとの集計は日番号（整数）で行い、最後に日付にする
+# 戻り値: (daily, period)
+#   daily  : 列 bucket, Date, mean, std, count, min, max（区分・日付順）
+#   period : 区分ラベルをインデックスとする mean, std, count, min, max
+def bucket_stats(df, bins=DAY_NIGHT_BINS):
+    bins = check_bins(bins)
+    labels = [b[0] for b in bins]
+    times = time_values(df['time'])
+    g = np.asarray(df['glucose'], dtype=float)
+    idx = tag_buckets(times, bins)
+    keep = (idx >= 0) & ~np.isnan(g)
+    frame = pd.DataFrame({
+        'bucket': pd.Categorical.from_codes(idx[keep], categories=labels),
+        'Date': day_numbers(times)[keep],
+        'glucose': g[keep],
+    })
+    daily = frame.groupby(['bucket', 'Date'], observed=True)['glucose'].agg(STAT_COLUMNS).reset_index()
+    daily['Date'] = day_dates(daily['Date'])
+    period = frame.groupby('bucket', observed=False)['glucose'].agg(STAT_COLUMNS)
+    period.index = period.index.astype(str)
+    return daily, period
+
+
+# 積算する十分統計量の列
+SUM_COLUMNS = ['count', 'sum', 'sumsq', 'min', 'max']
+_SUM_AGG = {'count': 'sum', 'sum': 'sum', 'sumsq': 'sum', 'min': 'min', 'max': 'max'}
+
+
+# 区分・日付ごとの十分統計量（count / sum / sum of squares / min / max）を求める
+# インデックスは (bucket: 区分番号, Date)。sum・min・max は _SHIFT を引いた値
+def bucket_sums(df, bins=DAY_NIGHT_BINS):
+    bins = check_bins(bins)
+    times = time_values(df['time'])
+    g = np.asarray(df['glucose'], dtype=float)
+    idx = tag_buckets(times, bins)
+    keep = (idx >= 0) & ~np.isnan(g)
+    g = g[keep] - _SHIFT
+    sums = pd.DataFrame({
+        'bucket': idx[keep],
+        'Date': day_numbers(times)[keep],
+        'count': 1,
+        'sum': g,
+        'sumsq': g * g,
+        'min': g,
+        'max': g,
+    }).groupby(['bucket', 'Date']).agg(_SUM_AGG)
+    sums.index = sums.index.set_levels(pd.Index(day_dates(sums.index.levels[1])), level='Date')
+    return sums
+
+
+# 2つの十分統計量を合算する（同じ区分・日付は count / sum を足し、min / max をとる）
+def combine_sums(a, b):
+    a, b = a.align(b)
+    acc = a[['count', 'sum', 'sumsq']].fillna(0) + b[['count', 'sum', 'sumsq']].fillna(0)
+    acc['min'] = np.fmin(a['min'], b['min'])
+    acc['max'] = np.fmax(a['max'], b['max'])
+    return acc
+
+
+# count / sum / sum of squares / min / max の積算値から統計量を作る（std は pandas と同じ ddof=1）
+def _finish(acc):
+    n = acc['count']
+    mean = acc['sum'] / n + _SHIFT
+    var = (acc['sumsq'] - acc['sum'] ** 2 / n) / (n - 1)
+    std = np.sqrt(var.clip(lower=0)).where(n > 1)
+    return pd.DataFrame({'mean': mean, 'std': std, 'count': n.fillna(0).astype(int),
+                         'min': acc['min'] + _SHIFT, 'max': acc['max'] + _SHIFT})
+
+
+# 十分統計量から bucket_stats と同じ形の (daily, period) を作る
+def sums_to_stats(acc, bins=DAY_NIGHT_BINS):
+    labels = [b[0] for b in check_bins(bins)]
+    if acc is None or acc.empty:
+        acc = pd.DataFrame(columns=SUM_COLUMNS, dtype=float,
+                           index=pd.MultiIndex.from_arrays([[], []], names=['bucket', 'Date']))
+    acc = acc.sort_index()
+    daily = _finish(acc).reset_index()
+    daily['bucket'] = pd.Categorical.from_codes(daily['bucket'].astype(int), categories=labels)
+    totals = acc.groupby(level='bucket').agg(_SUM_AGG)
+    period = _finish(totals.reindex(range(len(labels))))
+    period.index = pd.Index(labels, name='bucket')
+    return daily, period
+
+
+# CSV をチャンクごとに読み、時間帯区分ごとの日別統計を積算する（メモリ使用量はチャンクサイズで決まる）
+# load_glucose_csv と同じく、時刻の無い行と重複行（時刻・グルコース値が同じ行）は数えない
+# 同じ時刻の行がチャンクの境目をまたぐ場合に備えて、前のチャンクの最後の時刻の行を次のチャンクに持ち越して比べる
+# そのため CSV は時刻順であること（時刻が戻る行があれば ValueError。並べ替えが必要なら読み込んでから bucket_stats を使う）
+# 戻り値は bucket_stats と同じ (daily, period)
+def stream_bucket_stats(csv_file, start_date, end_date, bins=DAY_NIGHT_BINS, chunksize=200_000):
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    acc = None
+    carry = None
+    for chunk in pd.read_csv(csv_file, usecols=['time', 'glucose'], parse_dates=['time'], chunksize=chunksize):
+        chunk = chunk.dropna(subset=['time'])
+        carried = 0 if carry is None else len(carry)
+        if carried:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+        t = chunk['time'].to_numpy(dtype='datetime64[ns]')
+        if not (t[1:] >= t[:-1]).all():
+            raise ValueError(f'{csv_file} is not in time order; streaming statistics need a time-ordered export')
+        keep = ~chunk.duplicated(subset=['time', 'glucose']).to_numpy()
+        carry = chunk[keep & (t == t[-1])]
+        keep[:carried] = False
+        chunk = chunk[keep]
+        chunk = chunk[(chunk['time'] >= start) & (chunk['time'] <= end)]
+        if chunk.empty:
+            continue
+        part = bucket_sums(chunk, bins)
+        acc = part if acc is None else combine_sums(acc, part)
+    return sums_to_stats(acc, bins)
+
+
+# 日別統計から1つの区分の表（Date, mean, std）を取り出す（エラーバーのグラフ用）
+def bucket_table(daily, label):
+    return daily[daily['bucket'] == label][['Date', 'mean', 'std']].reset_index(drop=True)
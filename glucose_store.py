@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from glucose_io import load_glucose_csv, time_values, day_numbers, day_dates, range_bounds
+from glucose_stats import DAY_NIGHT_BINS, SUM_COLUMNS, check_bins, bucket_sums, sums_to_stats
+
+# 患者ごとの日別集計ストアの保存先
+STORE_DIR_NAME = '.glucose_store'
+STORE_VERSION = 2
+
+# ストアには日別の十分統計量と、取り込んだ測定値（時刻・グルコース値）を保存する
+# 測定値は、エクスポートの重なる日を保存済みの測定値と合わせて再集計するためと、期間の端の日を集計するために使う
+# （測定値を持たないバージョン 1 のストアは空のストアとして扱うので、エクスポートを取り込み直す）
+
+
+# CSV ファイル名（例: 230722-240126_murata.csv）から患者名を取り出す
+def patient_name(csv_file):
+    stem = os.path.splitext(os.path.basename(csv_file))[0]
+    return stem.split('_', 1)[1] if '_' in stem else stem
+
+
+def store_path(patient, store_dir=STORE_DIR_NAME):
+    return os.path.join(store_dir, f'{patient}.npz')
+
+
+# 測定値の表（time, glucose）。時刻・グルコース値の無い行を除く
+def _readings(df):
+    t = time_values(df['time']).astype('datetime64[ns]')
+    g = np.asarray(df['glucose'], dtype=float)
+    ok = ~np.isnat(t) & ~np.isnan(g)
+    return pd.DataFrame({'time': t[ok], 'glucose': g[ok]})
+
+
+# 日ごとの内容の指紋（測定数と、行ごとのハッシュの合計。行の順番によらない）。インデックスは日番号
+# readings は時刻順であること
+def _day_digests(readings):
+    days = day_numbers(readings['time'])
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]) if len(days) else np.empty(0, dtype=np.int64)
+    hashes = pd.util.hash_pandas_object(readings[['time', 'glucose']], index=False).to_numpy()
+    return pd.DataFrame({'n': np.diff(np.r_[starts, len(days)]),
+                         'hash': np.add.reduceat(hashes, starts) if len(days) else hashes},
+                        index=days[starts])
+
+
+# ストアを読み込む（無い場合・区分が変わった場合は空のストア）
+def load_store(path, bins=DAY_NIGHT_BINS):
+    bins = check_bins(bins)
+    empty = {
+        'sums': pd.DataFrame(columns=SUM_COLUMNS, dtype=float,
+                             index=pd.MultiIndex.from_arrays([[], []], names=['bucket', 'Date'])),
+        'readings': _readings(pd.DataFrame({'time': np.empty(0, 'datetime64[ns]'), 'glucose': np.empty(0)})),
+        'bins': bins,
+    }
+    if not os.path.exists(path):
+        return empty
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('version') != STORE_VERSION or [tuple(b) for b in meta['bins']] != bins:
+            return empty
+        index = pd.MultiIndex.from_arrays([data['bucket'], data['date'].astype(object)], names=['bucket', 'Date'])
+        sums = pd.DataFrame({col: data[col] for col in SUM_COLUMNS}, index=index)
+        readings = pd.DataFrame({'time': data['time'], 'glucose': data['glucose']})
+    return {'sums': sums, 'readings': readings, 'bins': bins}
+
+
+def save_store(path, store):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    sums = store['sums']
+    arrays = {col: sums[col].to_numpy(dtype=float) for col in SUM_COLUMNS}
+    arrays['bucket'] = sums.index.get_level_values('bucket').to_numpy(dtype=np.int16)
+    arrays['date'] = np.array(sums.index.get_level_values('Date'), dtype='datetime64[D]')
+    arrays['time'] = store['readings']['time'].to_numpy(dtype='datetime64[ns]')
+    arrays['glucose'] = store['readings']['glucose'].to_numpy(dtype=float)
+    arrays['meta'] = np.array(json.dumps({'version': STORE_VERSION, 'bins': store['bins']}))
+    tmp = f'{path}.tmp-{os.getpid()}.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+# 新しいエクスポートをストアに取り込む。内容が変わった日だけを再集計する
+# 新しいエクスポートにある時刻の測定値は、保存済みの測定値を置き換える（値を修正した再エクスポートは新しい方が優先）
+# それ以外の時刻の保存済みの測定値は残すので、日の途中から始まるエクスポートでもその日の前半は失われない
+# 1つのエクスポート内の同時刻の測定値は load_glucose_csv と同じく全て残す
+# 測定値の並べ直しは新しいエクスポートの期間の日だけで行う
+# 戻り値: (store, changed_dates)
+def update_store(store, df):
+    new = _readings(df)
+    if new.empty:
+        return store, []
+    t_new = new['time'].to_numpy()
+    if not (t_new[1:] >= t_new[:-1]).all():
+        new = new.iloc[np.argsort(t_new, kind='stable')].reset_index(drop=True)
+        t_new = new['time'].to_numpy()
+
+    # 新しいエクスポートの期間（最初の日の 0時〜最後の日の翌日 0時）の保存済みの測定値だけを合わせる
+    old = store['readings']
+    bounds = np.array([t_new[0].astype('datetime64[D]'), t_new[-1].astype('datetime64[D]') + 1], dtype='datetime64[ns]')
+    i, j = np.searchsorted(old['time'].to_numpy(), bounds)
+    window = old.iloc[i:j]
+    merged = pd.concat([window[~np.isin(window['time'].to_numpy(), t_new)], new], ignore_index=True)
+    merged = merged.iloc[np.argsort(merged['time'].to_numpy(), kind='stable')].reset_index(drop=True)
+
+    before, after = _day_digests(window), _day_digests(merged)
+    known = after.index.isin(before.index)
+    differs = np.ones(len(after), dtype=bool)
+    differs[known] = (before.loc[after.index[known]].to_numpy() != after[known].to_numpy()).any(axis=1)
+    changed = after.index[differs]
+    if len(changed) == 0:
+        return store, []
+
+    changed_set = set(day_dates(changed))
+    rows = merged[np.isin(day_numbers(merged['time']), changed)]
+    new_sums = bucket_sums(rows, store['bins'])
+    kept = store['sums'][~store['sums'].index.get_level_values('Date').isin(changed_set)]
+    store = {
+        'sums': pd.concat([kept, new_sums]).sort_index(),
+        'readings': pd.concat([old.iloc[:i], merged, old.iloc[j:]], ignore_index=True),
+        'bins': store['bins'],
+    }
+    return store, sorted(changed_set)
+
+
+# ストアから期間（開始 <= 時刻 <= 終了。time_range と同じ）の日別統計と期間統計を取り出す
+# 期間に丸ごと入る日は日別の集計値を使い、途中で始まる・終わる端の日は測定値から集計する
+# （例えば終了が日付だけなら、その日は 00:00 の測定値だけが入る）
+# 戻り値は bucket_stats と同じ (daily, period)
+def store_stats(store, start_date, end_date):
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    first = start.ceil('D')
+    last = (end + pd.Timedelta(1, 'ns')).floor('D')   # 丸ごと入る日は first <= 日 < last
+    dates = np.array(store['sums'].index.get_level_values('Date'), dtype='datetime64[D]')
+    full = (dates >= np.datetime64(first.date(), 'D')) & (dates < np.datetime64(last.date(), 'D'))
+    parts = [store['sums'][full]]
+    i, j = range_bounds(store['readings'], start, end)
+    rows = store['readings'].iloc[i:j]
+    t = rows['time'].to_numpy()
+    edge = rows[(t < np.datetime64(first)) | (t >= np.datetime64(last))]
+    if len(edge):
+        parts.append(bucket_sums(edge, store['bins']))
+    return sums_to_stats(pd.concat(parts), store['bins'])
+
+
+# CSV を読み込んでストアを更新し、保存する
+def update_from_csv(csv_file, store_dir=STORE_DIR_NAME, bins=DAY_NIGHT_BINS, patient=None):
+    path = store_path(patient or patient_name(csv_file), store_dir)
+    store, changed = update_store(load_store(path, bins), load_glucose_csv(csv_file))
+    if changed:
+        save_store(path, store)
+    return path, store, changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental per-day glucose aggregate store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_update = sub.add_parser('update', help='import CSV exports into the per-patient stores')
+    p_update.add_argument('csv_files', nargs='+')
+    p_update.add_argument('--store-dir', default=STORE_DIR_NAME)
+    p_query = sub.add_parser('query', help='print daily and period statistics for a date range')
+    p_query.add_argument('patient')
+    p_query.add_argument('start_date')
+    p_query.add_argument('end_date')
+    p_query.add_argument('--store-dir', default=STORE_DIR_NAME)
+    args = parser.parse_args(argv)
+
+    if args.command == 'update':
+        for csv_file in args.csv_files:
+            path, _, changed = update_from_csv(csv_file, args.store_dir)
+            print(f'{csv_file} -> {path}: {len(changed)} day(s) recomputed')
+    elif args.command == 'query':
+        daily, period = store_stats(load_store(store_path(args.patient, args.store_dir)), args.start_date, args.end_date)
+        print(daily.to_string(index=False))
+        print()
+        print(period.to_string())
+
+
+if __name__ == '__main__':
+    main()
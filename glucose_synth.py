@@ -0,0 +1,92 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# 食事の時刻（時）と上昇の大きさ（mg/dL）
+_MEALS = [(7.5, 45.0), (12.5, 55.0), (19.0, 65.0)]
+
+
+# 食後の血糖上昇の形（約45分で最大、2-3時間で戻る）
+def _meal_response(hours_after):
+    h = np.clip(hours_after, 0, None)
+    return np.where(hours_after > 0, (h / 0.75) * np.exp(1 - h / 0.75), 0.0)
+
+
+# 合成の CGM データを作る（列 time, glucose。実際のエクスポートと同じ形式）
+#   days            : 期間の日数（1日〜数年）
+#   cadence         : 測定間隔（分。1 / 5 / 15 など）
+#   gaps_per_week   : 30分を超えるセンサーの欠測の1週間あたりの回数（長さは40分〜6時間）
+#   duplicate_rate  : 同じ時刻の行を重複させる割合（半分は同じ値、半分は異なる値）
+#   sensor_days     : センサー交換の間隔（日）。交換時は約1時間欠測する
+def synth_glucose(days, cadence=5, start='2023-01-01', gaps_per_week=2.0, duplicate_rate=0.002,
+                  sensor_days=14, seed=0):
+    rng = np.random.default_rng(seed)
+    step = np.timedelta64(int(round(cadence * 60)), 's')
+    n = int(days * 24 * 60 / cadence)
+    times = np.datetime64(pd.Timestamp(start), 's') + np.arange(n) * step
+    hours = (times - times.astype('datetime64[D]')) / np.timedelta64(1, 'h')
+    day_index = np.arange(n) * cadence / (24 * 60)
+
+    # 基礎値 + 日内変動（明け方に高い）+ 食事 + 日ごとの揺らぎ + ゆっくり変わるノイズ（AR(1)）
+    glucose = 100 + 8 * np.cos(2 * np.pi * (hours - 5) / 24)
+    day_number = day_index.astype(int)
+    for meal_hour, size in _MEALS:
+        shift = rng.normal(0, 0.5, day_number[-1] + 1)[day_number]
+        scale = rng.uniform(0.5, 1.4, day_number[-1] + 1)[day_number]
+        glucose += size * scale * _meal_response(hours - meal_hour - shift)
+    glucose += rng.normal(0, 6, day_number[-1] + 1)[day_number]
+    from scipy.signal import lfilter  # 平滑化と同じく scipy は必要なときだけ読み込む
+    ar = lfilter([1.0], [1.0, -0.97 ** cadence], rng.normal(0, 1.5, n))
+    glucose = np.clip(np.round(glucose + ar), 40, 400)
+
+    # 欠測（ランダムな欠測とセンサー交換）
+    keep = np.ones(n, dtype=bool)
+    n_gaps = rng.poisson(gaps_per_week * days / 7)
+    gap_starts = rng.integers(0, n, n_gaps)
+    gap_lengths = (rng.uniform(40, 360, n_gaps) / cadence).astype(int)
+    for s, length in zip(gap_starts, gap_lengths):
+        keep[s:s + length] = False
+    for change in np.arange(sensor_days, days, sensor_days):
+        s = int(change * 24 * 60 / cadence)
+        keep[s:s + int(60 / cadence) + 1] = False
+    times = times[keep]
+    glucose = glucose[keep]
+
+    # 同じ時刻の重複行（エクスポートの重なりや手入力の再記録を想定）
+    n_dup = int(len(times) * duplicate_rate)
+    if n_dup:
+        dup = np.sort(rng.choice(len(times), n_dup, replace=False))
+        dup_glucose = glucose[dup].copy()
+        changed = rng.random(n_dup) < 0.5
+        dup_glucose[changed] += rng.integers(-3, 4, changed.sum())
+        order = np.argsort(np.r_[np.arange(len(times)), dup], kind='stable')
+        times = np.r_[times, times[dup]][order]
+        glucose = np.r_[glucose, dup_glucose][order]
+
+    return pd.DataFrame({'time': times.astype('datetime64[ns]'), 'glucose': glucose})
+
+
+# 合成データを CSV（time,glucose）に書き出す
+def write_synth_csv(path, days, cadence=5, **kwargs):
+    df = synth_glucose(days, cadence, **kwargs)
+    df.to_csv(path, index=False, date_format='%Y-%m-%d %H:%M:%S', float_format='%.1f')
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic CGM export (time,glucose) for benchmarking')
+    parser.add_argument('output')
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--cadence', type=float, default=5, help='minutes between readings (1, 5, 15, ...)')
+    parser.add_argument('--start', default='2023-01-01')
+    parser.add_argument('--gaps-per-week', type=float, default=2.0)
+    parser.add_argument('--duplicate-rate', type=float, default=0.002)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    df = write_synth_csv(args.output, args.days, args.cadence, start=args.start, gaps_per_week=args.gaps_per_week,
+                         duplicate_rate=args.duplicate_rate, seed=args.seed)
+    print(f'{args.output}: {len(df)} rows, {df["time"].iloc[0]} - {df["time"].iloc[-1]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# バッチ処理では画面表示をしない（plt.show() を呼ばない非対話バックエンド）
+import matplotlib
+matplotlib.use('Agg')
+
+import pandas as pd
+from glucose_io import load_glucose_csv
+from glucose_archive import open_archive
+from glucose_store import patient_name
+from glucose_reports import REPORTS
+from report_deck import DeckBuilder, format_report
+from report_metrics import LOG_ENV, SUMMARY_ENV, MEMORY_ENV
+from report_cache import RESULT_CACHE_ENV, RESULT_CACHE_MB_ENV
+
+# レポートの種類ごとの既定テンプレート
+TEMPLATES = {
+    'monthly': 'presentation_a4_background_yoko.pptx',
+    'glucose': 'presentation_a4_background-2.pptx',
+    'race': 'presentation_a4_background-3.pptx',
+}
+
+
+# マニフェスト（CSV）からジョブを読み込む
+# 列: csv_file, report, start_date, end_date [, time_start, time_mid, time_end, events, template, compact, cgm_metrics,
+#     resample, overlay, highlight_days（; 区切りの日付）, archive（患者ごとのアーカイブのフォルダ）]
+# csv_file・events の相対パスはマニフェストのあるフォルダからのパスとして扱う
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path, newline='', encoding='utf-8-sig') as fp:
+        for row in csv.DictReader(fp):
+            job = {k: v.strip() for k, v in row.items() if k and v and v.strip()}
+            job['csv_file'] = os.path.join(base, job['csv_file'])
+            if 'events' in job:
+                job['events'] = os.path.join(base, job['events'])
+            jobs.append(job)
+    return jobs
+
+
+# フォルダ内の全 CSV を同じ種類・期間のジョブにする
+def jobs_from_directory(directory, report, start_date=None, end_date=None):
+    jobs = []
+    for csv_file in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        job = {'csv_file': csv_file, 'report': report}
+        if start_date:
+            job['start_date'] = start_date
+        if end_date:
+            job['end_date'] = end_date
+        jobs.append(job)
+    return jobs
+
+
+# ジョブの測定時刻（アーカイブを使う場合はアーカイブから）
+def _job_times(job):
+    if job.get('archive'):
+        return pd.Series(open_archive(patient_name(job['csv_file']), job['archive']).series()['time'])
+    return load_glucose_csv(job['csv_file'])['time']
+
+
+# 期間の指定がない場合はファイル（アーカイブを使う場合はアーカイブ）全体の期間を使う
+def _fill_date_range(job):
+    if 'start_date' in job and 'end_date' in job:
+        return
+    times = _job_times(job)
+    if times.empty:
+        raise ValueError(f"No readings in {job['csv_file']}")
+    job.setdefault('start_date', times.iloc[0].strftime('%Y-%m-%d'))
+    # 終了は最後の測定の時刻まで（日付だけにすると、終了は最終日の 0時になり最終日が抜ける）
+    job.setdefault('end_date', _format_bound(times.iloc[-1]))
+
+
+# 期間の境界を文字列にする（0時ちょうどなら日付だけ、それ以外は時刻まで）
+def _format_bound(ts):
+    return ts.strftime('%Y-%m-%d') if ts == ts.normalize() else str(ts)
+
+
+# 期間を暦月ごとのジョブに分ける（試合レポートは分けない）。label には月（例: 2023-08）を入れる
+# 期間の終了は時刻まで含む（時刻 <= 終了）ので、各月の終了は月末の日の終わり（23:59:59.999999999）にする
+def split_months(jobs):
+    split = []
+    for job in jobs:
+        if job.get('report') == 'race':
+            split.append(job)
+            continue
+        _fill_date_range(job)
+        start = pd.Timestamp(job['start_date'])
+        end = pd.Timestamp(job['end_date'])
+        for month in pd.period_range(start, end, freq='M'):
+            part = dict(job, label=str(month))
+            part['start_date'] = _format_bound(max(start, month.start_time))
+            part['end_date'] = _format_bound(min(end, month.end_time))
+            split.append(part)
+    return split
+
+
+# ジョブの引数をレポート関数の引数に変換する
+def job_kwargs(job, out_dir, template_dir='.', image_options=None):
+    report = job['report']
+    stem = os.path.splitext(os.path.basename(job['csv_file']))[0]
+    if 'label' in job:
+        stem = f"{stem}-{job['label']}"
+    kwargs = {
+        'csv_file': job['csv_file'],
+        'start_date': job['start_date'],
+        'end_date': job['end_date'],
+        'template': os.path.join(template_dir, job.get('template', TEMPLATES[report])),
+        'output': os.path.join(out_dir, f'{stem}-{report}.pptx'),
+        'out_dir': os.path.join(out_dir, stem),
+        'image_options': image_options,
+    }
+    if report == 'race':
+        if 'events' in job:
+            kwargs['events'] = job['events']
+        else:
+            for key in ('time_start', 'time_mid', 'time_end'):
+                kwargs[key] = job[key]
+    for key in ('compact', 'cgm_metrics'):
+        if str(job.get(key, '')).lower() in ('1', 'true', 'yes'):
+            kwargs[key] = True
+    if job.get('resample'):
+        kwargs['resample'] = int(job['resample'])
+    if job.get('archive'):
+        kwargs['archive'] = job['archive']
+    if report in ('glucose', 'race'):
+        if job.get('overlay'):
+            kwargs['overlay'] = job['overlay']
+        if job.get('highlight_days'):
+            days = job['highlight_days']
+            kwargs['highlight_days'] = [d.strip() for d in days.split(';') if d.strip()] if isinstance(days, str) else days
+    return kwargs
+
+
+# 1件のジョブを実行する（ワーカープロセス内で実行）。deck を指定するとその資料にスライドを追加する
+def run_job(job, out_dir, template_dir='.', image_options=None, deck=None):
+    started = time.perf_counter()
+    try:
+        if job.get('report') not in REPORTS:
+            raise ValueError(f"Unknown report type: {job.get('report')!r}")
+        _fill_date_range(job)
+        result = REPORTS[job['report']](**job_kwargs(job, out_dir, template_dir, image_options), deck=deck)
+        return {'job': job, 'ok': True, 'seconds': time.perf_counter() - started, 'output': result['output'],
+                'size_report': result.get('size_report'), 'metrics': result.get('metrics')}
+    except Exception as e:
+        return {'job': job, 'ok': False, 'seconds': time.perf_counter() - started,
+                'error': f'{type(e).__name__}: {e}', 'traceback': traceback.format_exc()}
+
+
+# 全ジョブを CPU コア数のプロセスで並列実行する
+def run_batch(jobs, out_dir, template_dir='.', workers=None, image_options=None):
+    os.makedirs(out_dir, exist_ok=True)
+    results = []
+    if workers == 1:
+        for job in jobs:
+            results.append(run_job(job, out_dir, template_dir, image_options))
+        return results
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job, out_dir, template_dir, image_options): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+# 全ジョブを1つの資料（患者ごと・月ごとに1枚）にまとめる。テンプレートの解析と保存は1回だけ行う
+# スライドを順番に追加するため、このプロセス内で1件ずつ実行する
+# 戻り値: (ジョブごとの結果, 資料のサイズと処理時間の報告)
+def run_deck(jobs, deck_path, out_dir, template_dir='.', image_options=None):
+    templates = {os.path.join(template_dir, job.get('template', TEMPLATES.get(job.get('report'), ''))) for job in jobs}
+    if len(templates) != 1:
+        raise ValueError(f'All jobs in one deck must share a template, got: {sorted(templates)}')
+    os.makedirs(out_dir, exist_ok=True)
+    deck = DeckBuilder(templates.pop(), deck_path)
+    results = [run_job(job, out_dir, template_dir, image_options, deck=deck) for job in jobs]
+    if len(deck):
+        deck.save()
+    return results, deck.report()
+
+
+# ジョブごとの成否と処理時間を表示する
+def print_summary(results, wall_seconds, file=sys.stdout):
+    for r in results:
+        name = os.path.basename(r['job']['csv_file'])
+        if 'label' in r['job']:
+            name = f"{name} [{r['job']['label']}]"
+        status = 'OK  ' if r['ok'] else 'FAIL'
+        detail = r['output'] if r['ok'] else r['error']
+        print(f"{status} {r['job'].get('report', '?'):8s} {name:40s} {r['seconds']:7.2f}s  {detail}", file=file)
+    failed = sum(not r['ok'] for r in results)
+    print(f'{len(results) - failed}/{len(results)} reports succeeded in {wall_seconds:.2f}s', file=file)
+    caches = [r['metrics']['cache'] for r in results if r['ok'] and r.get('metrics') and r['metrics'].get('cache')]
+    if caches:
+        print('result cache: ' + ', '.join(f'{k}={sum(c[k] for c in caches)}' for k in caches[0]), file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate glucose reports for many patient CSV files in parallel')
+    parser.add_argument('source', help='directory of CSV files, or a manifest CSV (csv_file, report, start_date, end_date, ...)')
+    parser.add_argument('--report', choices=sorted(REPORTS), default='glucose', help='report type for directory mode')
+    parser.add_argument('--start', help='start date for directory mode (default: first reading)')
+    parser.add_argument('--end', help='end date for directory mode (default: last reading)')
+    parser.add_argument('--out-dir', default='reports')
+    parser.add_argument('--template-dir', default='.')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--in-memory', action='store_true', help='insert charts into the slides without writing PNG files')
+    parser.add_argument('--debug-png', action='store_true', help='also write the intermediate PNG files in --in-memory mode')
+    parser.add_argument('--dpi', type=float, help='chart resolution')
+    parser.add_argument('--compress-level', type=int, choices=range(10), help='PNG compression level')
+    parser.add_argument('--slide-ppi', type=float, help='derive each chart\'s dpi from its on-slide size at this many pixels per inch')
+    parser.add_argument('--quantize', action='store_true', help='write 256-color palette PNGs')
+    parser.add_argument('--optimize', action='store_true', help='optimize PNG compression (lossless)')
+    parser.add_argument('--vector', choices=['svg'], help='embed charts as vector images with a low-resolution PNG fallback')
+    parser.add_argument('--size-report', action='store_true', help='print image sizes and render/save times per deck')
+    parser.add_argument('--deck', help='write all reports as slides of this single PPTX instead of one file per report')
+    parser.add_argument('--per-month', action='store_true', help='split each date range into calendar months (one report per month)')
+    parser.add_argument('--compact', action='store_true', help='load readings as compact int64-seconds/float32 series')
+    parser.add_argument('--cgm-metrics', action='store_true', help='add TIR/CV/GMI/MAGE to the report text boxes')
+    parser.add_argument('--resample', type=int, metavar='MINUTES',
+                        help='draw overlays and day/night stats from a regular days x slots grid (e.g. 5)')
+    parser.add_argument('--overlay', choices=['daily', 'agp'], help='daily lines, or percentile bands (AGP) for long ranges')
+    parser.add_argument('--highlight', action='append', metavar='DATE', help='draw this day as a line over the AGP bands (repeatable)')
+    parser.add_argument('--archive', metavar='DIR',
+                        help='read readings from the per-patient archives in DIR (see glucose_archive.py import)')
+    parser.add_argument('--result-cache', metavar='DIR',
+                        help='reuse charts and stats tables whose data and settings are unchanged (content-hash cache in DIR)')
+    parser.add_argument('--result-cache-mb', type=float, help='size limit of the result cache (least recently used entries are removed)')
+    parser.add_argument('--metrics-log', help='append one JSON line of per-stage timings and counts per report to this file')
+    parser.add_argument('--metrics-summary', action='store_true', help='print per-stage timings of each report to stderr')
+    parser.add_argument('--metrics-memory', action='store_true', help='also measure peak memory per stage (tracemalloc, slower)')
+    args = parser.parse_args(argv)
+    # 計測・キャッシュの設定は環境変数でワーカープロセスに引き継ぐ
+    if args.metrics_log:
+        os.environ[LOG_ENV] = os.path.abspath(args.metrics_log)
+    if args.metrics_summary:
+        os.environ[SUMMARY_ENV] = '1'
+    if args.metrics_memory:
+        os.environ[MEMORY_ENV] = '1'
+    if args.result_cache:
+        os.environ[RESULT_CACHE_ENV] = os.path.abspath(args.result_cache)
+    if args.result_cache_mb:
+        os.environ[RESULT_CACHE_MB_ENV] = str(args.result_cache_mb)
+    image_options = {'in_memory': args.in_memory, 'debug_png': args.debug_png,
+                     'dpi': args.dpi, 'compress_level': args.compress_level, 'slide_ppi': args.slide_ppi,
+                     'quantize': args.quantize, 'optimize': args.optimize, 'vector': args.vector}
+
+    if os.path.isdir(args.source):
+        jobs = jobs_from_directory(args.source, args.report, args.start, args.end)
+    else:
+        jobs = read_manifest(args.source)
+    # コマンドラインの既定値は月ごとに分ける前に入れる（--archive の場合は期間をアーカイブから決めるため）
+    for key in ('compact', 'cgm_metrics'):
+        if getattr(args, key):
+            for job in jobs:
+                job.setdefault(key, True)
+    for key, value in (('resample', args.resample), ('overlay', args.overlay), ('highlight_days', args.highlight),
+                       ('archive', args.archive)):
+        if value:
+            for job in jobs:
+                job.setdefault(key, value)
+    if args.per_month:
+        jobs = split_months(jobs)
+
+    started = time.perf_counter()
+    if args.deck:
+        results, size_report = run_deck(jobs, args.deck, args.out_dir, args.template_dir, image_options)
+        size_reports = [size_report]
+    else:
+        results = run_batch(jobs, args.out_dir, args.template_dir, args.jobs, image_options)
+        size_reports = [r['size_report'] for r in results if r['ok'] and r['size_report']]
+    print_summary(results, time.perf_counter() - started)
+    if args.size_report:
+        for size_report in size_reports:
+            print(format_report(size_report))
+    for r in results:
+        if not r['ok']:
+            print(f"\n{r['job']['csv_file']}:\n{r['traceback']}", file=sys.stderr)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
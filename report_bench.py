@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# ベンチマークでは画面表示をしない
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from glucose_io import load_glucose_csv, time_range
+from glucose_overlay import BASE_DATE, TIME_THRESHOLD, COLORS, split_daily_segments
+from glucose_stats import DAY_NIGHT_BINS, bucket_stats
+from glucose_events import event_bounds, event_curves
+from glucose_synth import write_synth_csv
+from report_figures import get_template, close_templates, OverlayFigure
+from report_deck import DeckBuilder
+from report_images import image_options, render_figure
+
+# 既定のデータセット（日数, 測定間隔（分））。--full では 1/5/15 分 × 1日〜3年の全組み合わせ
+DATASETS = [(1, 5), (30, 5), (180, 5), (365, 15)]
+FULL_DATASETS = [(days, cadence) for days in (1, 30, 365, 1095) for cadence in (1, 5, 15)]
+
+# 重ね描き・スライドは1レポート分（最後の30日）で測る
+REPORT_DAYS = 30
+
+RESULT_VERSION = 1
+
+
+# 関数を repeat 回実行して時間を測り、最後に tracemalloc を有効にしてもう1回実行しピークメモリを測る
+# 戻り値: (最後の実行結果, 計測値)
+def measure(fn, repeat=3):
+    walls, cpus = [], []
+    result = None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = fn()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {
+        'wall_min': min(walls),
+        'wall_median': statistics.median(walls),
+        'cpu_min': min(cpus),
+        'peak_bytes': peak,
+        'repeat': repeat,
+    }
+
+
+# 1つのデータセットで各段階を測る
+def bench_dataset(csv_file, template, work_dir, repeat=3):
+    stages = {}
+    cache_dir = os.path.join(work_dir, 'cache')
+
+    # 読み込み（CSV の解析 / 解析済みキャッシュ）
+    df, stages['load'] = measure(lambda: load_glucose_csv(csv_file, cache=False), repeat)
+    load_glucose_csv(csv_file, cache_dir=cache_dir)
+    _, stages['load_cached'] = measure(lambda: load_glucose_csv(csv_file, cache_dir=cache_dir), repeat)
+    stages['load']['rows'] = len(df)
+    stages['load_cached']['bytes'] = int(df.memory_usage(deep=True).sum())
+
+    # コンパクトな表現（GlucoseSeries: int64 の秒と float32）での読み込みと統計
+    compact, stages['load_compact'] = measure(lambda: load_glucose_csv(csv_file, cache_dir=cache_dir, compact=True), repeat)
+    stages['load_compact']['bytes'] = compact.nbytes
+
+    # 期間の絞り込み（最後の REPORT_DAYS 日）
+    end = df['time'].iloc[-1].normalize() + pd.Timedelta(days=1)
+    start = max(end - pd.Timedelta(days=REPORT_DAYS), df['time'].iloc[0].normalize())
+    window, stages['filter'] = measure(lambda: time_range(df, start, end), repeat)
+    stages['filter']['rows'] = len(window)
+
+    # 0-6時 / 6-24時の統計（全期間）
+    _, stages['day_night_stats'] = measure(lambda: bucket_stats(df, DAY_NIGHT_BINS), repeat)
+    _, stages['day_night_stats_compact'] = measure(lambda: bucket_stats(compact, DAY_NIGHT_BINS), repeat)
+
+    # 日ごとのセグメント作成（1レポート分）
+    (segments, segment_days), stages['segments'] = measure(
+        lambda: split_daily_segments(window['time'], window['glucose'], TIME_THRESHOLD, BASE_DATE), repeat)
+    stages['segments']['segments'] = len(segments)
+    stages['segments']['vertices'] = int(sum(len(s) for s in segments))
+
+    # 重ね描きグラフの描画（PNG をメモリ上に保存）
+    options = image_options({'in_memory': True})
+    first_day = min(segment_days) if segment_days else start.date()
+    colors = [COLORS[(day - first_day).days % len(COLORS)] for day in segment_days]
+    legend = {day.strftime('%Y-%m-%d'): color for day, color in dict(zip(segment_days, colors)).items()}
+
+    def render_overlay():
+        with plt.rc_context({'font.size': 24}):
+            figure = get_template(OverlayFigure, ylim=(50, 200), legend_size=18)
+            figure.update(segments, colors, legend)
+            return render_figure(figure.save, 'overlay.png', options)
+    overlay_image, stages['overlay_render'] = measure(render_overlay, repeat)
+    stages['overlay_render']['bytes'] = overlay_image.stats['bytes']
+
+    # 試合の区間（全期間で毎日1回、10:00-12:00-13:30）
+    days = pd.date_range(df['time'].iloc[0].normalize(), df['time'].iloc[-1].normalize(), freq='D')
+    events = [{'time_start': d + pd.Timedelta(hours=10), 'time_mid': d + pd.Timedelta(hours=12),
+               'time_end': d + pd.Timedelta(hours=13.5), 'label': ''} for d in days]
+    times = df['time'].to_numpy(dtype='datetime64[ns]')
+    x = mdates.date2num(times)
+    g = df['glucose'].to_numpy(dtype=float)
+
+    def race_windows():
+        return [event_curves(x, g, b, e['time_mid']) for e, b in zip(events, event_bounds(times, events))]
+    _, stages['race_windows'] = measure(race_windows, repeat)
+    stages['race_windows']['events'] = len(events)
+
+    # PowerPoint の資料作成（1か月1枚とし、テンプレートの複製・画像の挿入・保存まで）
+    n_slides = max(1, len(days) // 30)
+    output = os.path.join(work_dir, 'deck.pptx')
+
+    def assemble():
+        deck = DeckBuilder(template, output)
+        for i in range(n_slides):
+            deck.add_slide('glucose', {'overlay': overlay_image}, {'name': f'slide {i + 1}'})
+        deck.save()
+        return deck
+    _, stages['pptx'] = measure(assemble, repeat)
+    stages['pptx']['slides'] = n_slides
+    stages['pptx']['bytes'] = os.path.getsize(output)
+    return stages
+
+
+# 実行環境（比較のためにコミット・ライブラリのバージョンを記録する）
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pptx
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+        'python-pptx': pptx.__version__,
+    }
+
+
+# 全データセットで測り、結果を JSON に保存する
+def run_benchmarks(datasets=DATASETS, output='benchmark.json', template=None, repeat=3, seed=0, log=sys.stderr):
+    results = {'version': RESULT_VERSION, 'environment': environment(), 'datasets': []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        if template is None:
+            # テンプレートの指定が無ければ python-pptx の既定の空の資料を使う
+            from pptx import Presentation
+            template = os.path.join(work_dir, 'template.pptx')
+            Presentation().save(template)
+        for days, cadence in datasets:
+            name = f'{days}d-{cadence}min'
+            csv_file = os.path.join(work_dir, f'{name}.csv')
+            rows = len(write_synth_csv(csv_file, days, cadence, seed=seed))
+            started = time.perf_counter()
+            stages = bench_dataset(csv_file, template, os.path.join(work_dir, name), repeat)
+            close_templates()
+            results['datasets'].append({'name': name, 'days': days, 'cadence': cadence, 'rows': rows,
+                                        'csv_bytes': os.path.getsize(csv_file), 'stages': stages})
+            print(f'{name}: {rows} rows, {time.perf_counter() - started:.1f}s', file=log)
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(results, fp, indent=2)
+    return results
+
+
+# 結果の表を表示する
+def print_results(results, file=sys.stdout):
+    for dataset in results['datasets']:
+        print(f"{dataset['name']} ({dataset['rows']} rows)", file=file)
+        for stage, m in dataset['stages'].items():
+            print(f"  {stage:24s} {m['wall_min'] * 1000:10.2f} ms  cpu {m['cpu_min'] * 1000:10.2f} ms  "
+                  f"peak {m['peak_bytes'] / 2 ** 20:8.2f} MiB", file=file)
+
+
+# 2つの結果（変更前・変更後）を段階ごとに比べる。ratio < 1 なら速くなった
+def compare(before, after, file=sys.stdout):
+    old = {d['name']: d for d in before['datasets']}
+    print(f"{before['environment'].get('commit')} -> {after['environment'].get('commit')}", file=file)
+    for dataset in after['datasets']:
+        base = old.get(dataset['name'])
+        if base is None:
+            continue
+        print(dataset['name'], file=file)
+        for stage, m in dataset['stages'].items():
+            if stage not in base['stages']:
+                continue
+            b = base['stages'][stage]
+            ratio = m['wall_min'] / b['wall_min'] if b['wall_min'] else float('nan')
+            mem = m['peak_bytes'] / b['peak_bytes'] if b['peak_bytes'] else float('nan')
+            print(f"  {stage:24s} {b['wall_min'] * 1000:10.2f} -> {m['wall_min'] * 1000:10.2f} ms  x{ratio:5.2f}  "
+                  f"peak x{mem:5.2f}", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-stage benchmarks on synthetic CGM data')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_run = sub.add_parser('run', help='run the benchmark suite and write a JSON result file')
+    p_run.add_argument('-o', '--output', default='benchmark.json')
+    p_run.add_argument('--full', action='store_true', help='1/5/15-minute cadences over 1 day to 3 years')
+    p_run.add_argument('--dataset', action='append', metavar='DAYS:CADENCE', help='custom dataset, e.g. 90:5 (repeatable)')
+    p_run.add_argument('--template', help='PPTX template for the assembly stage (default: blank deck)')
+    p_run.add_argument('--repeat', type=int, default=3)
+    p_run.add_argument('--seed', type=int, default=0)
+    p_compare = sub.add_parser('compare', help='compare two result files stage by stage')
+    p_compare.add_argument('before')
+    p_compare.add_argument('after')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.before, encoding='utf-8') as a, open(args.after, encoding='utf-8') as b:
+            compare(json.load(a), json.load(b))
+        return 0
+
+    if args.dataset:
+        datasets = [(float(d), float(c)) for d, c in (spec.split(':') for spec in args.dataset)]
+        datasets = [(int(d) if d.is_integer() else d, int(c) if c.is_integer() else c) for d, c in datasets]
+    else:
+        datasets = FULL_DATASETS if args.full else DATASETS
+    results = run_benchmarks(datasets, args.output, args.template, args.repeat, args.seed)
+    print_results(results)
+    print(f'written {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import numpy as np
+import pandas as pd
+import matplotlib
+from glucose_io import time_values
+from report_images import RenderedImage, RenderedPath
+
+# 環境変数による既定の設定
+#   GLUCOSE_RESULT_CACHE    : 描画したグラフ・集計した表のキャッシュのフォルダ（未設定ならキャッシュしない）
+#   GLUCOSE_RESULT_CACHE_MB : キャッシュの上限（MB）。超えたら最後に使ったのが古いものから削除する
+RESULT_CACHE_ENV = 'GLUCOSE_RESULT_CACHE'
+RESULT_CACHE_MB_ENV = 'GLUCOSE_RESULT_CACHE_MB'
+DEFAULT_MAX_MB = 512
+
+# 描画・集計のコードを変えて結果が変わる場合はこの番号を上げる（古い結果を使わないため）
+RESULT_VERSION = 1
+
+# 画像の内容に関わる出力設定（in_memory・debug_png は出力先だけなので含めない）
+_RENDER_OPTIONS = ('dpi', 'compress_level', 'slide_ppi', 'quantize', 'optimize', 'vector')
+_SUFFIX = '.pkl'
+
+
+def _update(h, part):
+    if isinstance(part, np.ndarray):
+        h.update(f'array{part.dtype.str}{part.shape}'.encode())
+        h.update(np.ascontiguousarray(part).tobytes())
+    elif isinstance(part, pd.DataFrame):
+        h.update(f'frame{list(part.columns)}'.encode())
+        h.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+    elif isinstance(part, (list, tuple)):
+        h.update(b'(')
+        for p in part:
+            _update(h, p)
+        h.update(b')')
+    elif isinstance(part, dict):
+        _update(h, sorted(part.items(), key=lambda item: repr(item[0])))
+    else:
+        h.update(repr(part).encode('utf-8'))
+    h.update(b'|')
+
+
+# キーの材料（配列・表は内容、それ以外は repr）からキャッシュのキーを作る
+def content_key(*parts):
+    h = hashlib.sha1(f'{RESULT_VERSION}|{matplotlib.__version__}|{pd.__version__}'.encode())
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+
+# 測定値（DataFrame または GlucoseSeries）の内容のキー。読み込み方法（compact・アーカイブ）が違っても同じ値になる
+def series_key(df):
+    return content_key(time_values(df['time']).astype('datetime64[ns]'), np.asarray(df['glucose'], dtype=float))
+
+
+# 内容のハッシュをキーとする結果のキャッシュ（1件 1ファイル）
+# 使うたびにファイルの更新時刻を新しくし、合計の大きさが上限を超えたら古いものから削除する（LRU）
+# counts にこのインスタンスでのヒット・ミス・保存・削除の件数を数える
+class ResultCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_MB * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.counts = {'hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0}
+
+    # 環境変数の設定から作る（フォルダの指定がなければ None）
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get(RESULT_CACHE_ENV)
+        if not directory:
+            return None
+        return cls(directory, float(os.environ.get(RESULT_CACHE_MB_ENV) or DEFAULT_MAX_MB) * 2 ** 20)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}{_SUFFIX}')
+
+    # キャッシュの値を返す（無ければ None）
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                value = pickle.load(fp)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.counts['misses'] += 1
+            return None
+        self.counts['hits'] += 1
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f'{path}.tmp-{os.getpid()}'
+        with open(tmp, 'wb') as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.counts['stores'] += 1
+        self.counts['evicted'] += len(evict(self.directory, self.max_bytes))
+
+    # 描画結果を render_figure と同じ形（options に応じてファイルまたはメモリ上のバッファ）で返す（無ければ None）
+    # キーには画像の内容に関わる出力設定と、フォントの設定を加える
+    def load_image(self, parts, path, options):
+        entry = self.get(self._image_key(parts, options))
+        if entry is None:
+            return None
+        if not options['in_memory'] or options['debug_png']:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'wb') as fp:
+                fp.write(entry['data'])
+            if entry['svg'] is not None:
+                with open(f'{os.path.splitext(path)[0]}.svg', 'wb') as fp:
+                    fp.write(entry['svg'])
+        image = RenderedImage(entry['data']) if options['in_memory'] else RenderedPath(path)
+        image.svg = entry['svg']
+        image.stats = dict(entry['stats'], seconds=0.0, cached=True)
+        return image
+
+    def store_image(self, parts, image, options):
+        if isinstance(image, RenderedImage):
+            data = image.getvalue()
+        else:
+            with open(image, 'rb') as fp:
+                data = fp.read()
+        self.put(self._image_key(parts, options), {'data': data, 'svg': image.svg, 'stats': image.stats})
+
+    def _image_key(self, parts, options):
+        rc = {name: matplotlib.rcParams[name] for name in ('font.family', 'font.weight', 'font.size')}
+        return content_key('image', parts, {name: options[name] for name in _RENDER_OPTIONS}, rc)
+
+
+# 合計の大きさが max_bytes 以下になるまで、最後に使ったのが古いファイルから削除する
+# 戻り値: 削除したファイル名のリスト
+def evict(directory, max_bytes):
+    entries = []
+    try:
+        scan = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+    for entry in scan:
+        if entry.name.endswith(_SUFFIX):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.name))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(name)
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Content-hash cache of rendered charts and computed tables')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_info = sub.add_parser('info', help='print the number and total size of the cache entries')
+    p_trim = sub.add_parser('trim', help='remove least recently used entries down to a size limit')
+    p_trim.add_argument('--max-mb', type=float, default=None, help=f'size limit (default: ${RESULT_CACHE_MB_ENV} or {DEFAULT_MAX_MB})')
+    for p in (p_info, p_trim):
+        p.add_argument('cache_dir', nargs='?', default=os.environ.get(RESULT_CACHE_ENV))
+    args = parser.parse_args(argv)
+    if not args.cache_dir:
+        parser.error(f'give a cache directory or set {RESULT_CACHE_ENV}')
+
+    if args.command == 'trim':
+        max_mb = args.max_mb if args.max_mb is not None else float(os.environ.get(RESULT_CACHE_MB_ENV) or DEFAULT_MAX_MB)
+        removed = evict(args.cache_dir, max_mb * 2 ** 20)
+        print(f'removed {len(removed)} entries')
+    names = [e for e in os.scandir(args.cache_dir) if e.name.endswith(_SUFFIX)] if os.path.isdir(args.cache_dir) else []
+    print(f'{args.cache_dir}: {len(names)} entries, {sum(e.stat().st_size for e in names) / 2 ** 20:.1f} MB')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
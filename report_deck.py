@@ -0,0 +1,232 @@
+import copy
+import io
+import os
+import time
+from pptx import Presentation
+from pptx.opc.package import Part
+from pptx.oxml import parse_xml
+from pptx.util import Inches, Pt
+from pptx.enum.text import PP_ALIGN
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml.ns import qn
+
+# レポートの種類ごとのスライドの配置（1人分・1か月分のレポートで共通）
+#   pictures : 名前 -> (left, top, width, height)。width / height が None なら画像の比率に合わせる
+#   texts    : 名前 -> (left, top, width, height, フォントサイズ)
+# 画像・テキストはこの順番で重ねて配置する
+LAYOUTS = {
+    'monthly': {
+        'pictures': {
+            'graph': (Inches(-2 / 2.54), Inches(3 / 2.54), None, Inches(5)),
+            'legend': (Inches(20.5 / 2.54), Inches(14.5 / 2.54), None, None),
+        },
+        'texts': {
+            'averages': (Inches(1 / 2.54), Inches(16.5 / 2.54), Inches(5), Inches(1), 14),
+            'period': (Inches(21.2 / 2.54), Inches(-0.05 / 2.54), Inches(6), Inches(1), 14),
+        },
+    },
+    'glucose': {
+        'pictures': {
+            'overlay': (Inches(0.8 / 2.54), Inches(5 / 2.54), Inches(18 / 2.54), None),
+            'graph': (Inches(1.5 / 2.54), Inches(18 / 2.54), Inches(16 / 2.54), None),
+        },
+        'texts': {
+            'averages': (Inches(1 / 2.54), Inches(25.4 / 2.54), Inches(6 / 2.54), Inches(1.5 / 2.54), 12),
+            'period': (Inches(13.5 / 2.54), Inches(0.04 / 2.54), Inches(6 / 2.54), Inches(1 / 2.54), 12),
+            'name': (Inches(3.0 / 2.54), Inches(1.4 / 2.54), Inches(6 / 2.54), Inches(1 / 2.54), 12),
+        },
+    },
+    'race': {
+        'pictures': {
+            'overlay': (Inches(0.8 / 2.54), Inches(5 / 2.54), Inches(18 / 2.54), None),
+            'graph': (Inches(1.5 / 2.54), Inches(18 / 2.54), Inches(16 / 2.54), None),
+        },
+        'texts': {
+            'averages': (Inches(1 / 2.54), Inches(25.4 / 2.54), Inches(6 / 2.54), Inches(1.5 / 2.54), 12),
+            'period': (Inches(13.5 / 2.54), Inches(0.04 / 2.54), Inches(6 / 2.54), Inches(1 / 2.54), 12),
+            'name': (Inches(3.41 / 2.54), Inches(1.46 / 2.54), Inches(6 / 2.54), Inches(1 / 2.54), 12),
+        },
+    },
+}
+
+# 解析済みテンプレートのキャッシュ（パス -> (更新時刻, Presentation)）
+_TEMPLATE_CACHE = {}
+
+
+# テンプレートを開く。解析した Presentation はプロセス内でキャッシュし、ジョブごとにその複製を返す
+# （読み込みと XML の解析はファイルが変わったときだけ。複製への変更はキャッシュに影響しない）
+def load_template(template):
+    path = os.path.abspath(template)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _TEMPLATE_CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as fp:
+            cached = _TEMPLATE_CACHE[path] = (mtime, Presentation(io.BytesIO(fp.read())))
+    return copy.deepcopy(cached[1])
+
+
+# テンプレートの最初のスライドを取得（または新しいスライドを作成）
+def first_slide(prs):
+    if len(prs.slides) > 0:
+        return prs.slides[0]
+    slide_layout = prs.slide_layouts[5]  # 適切なレイアウトを選択
+    return prs.slides.add_slide(slide_layout)
+
+
+# スライドの複製で引き継がない関係（レイアウトは add_slide で、ノートは複製しない）
+_SKIP_RELS = (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE)
+
+# 画像などの関係 ID を持つ属性
+_REL_ATTRS = (qn('r:embed'), qn('r:link'), qn('r:id'))
+
+
+# SVG 画像を PowerPoint の拡張（svgBlip）として図に付ける。PNG は SVG 非対応のソフト用の代替画像になる
+_SVG_EXT_URI = '{96DAC541-7B7A-43D3-8B79-37D633B846F1}'
+
+
+def _attach_svg(picture, svg):
+    slide_part = picture.part
+    package = slide_part.package
+    part = Part(package.next_partname('/ppt/media/image%d.svg'), 'image/svg+xml', package, svg)
+    rId = slide_part.relate_to(part, RT.IMAGE)
+    picture._element.blipFill.blip.append(parse_xml(
+        '<a:extLst xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+        f'<a:ext uri="{_SVG_EXT_URI}">'
+        '<asvg:svgBlip xmlns:asvg="http://schemas.microsoft.com/office/drawing/2016/SVG/main"'
+        ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+        f' r:embed="{rId}"/></a:ext></a:extLst>'))
+
+
+# 配置の中の画像のスライド上の大きさ (width, height)（EMU。指定の無い方は None）
+def picture_size(layout, name):
+    left, top, width, height = LAYOUTS[layout]['pictures'][name]
+    return width, height
+
+
+# テキストボックスを挿入
+def add_text(slide, left, top, width, height, text, size):
+    textbox = slide.shapes.add_textbox(left, top, width=width, height=height)
+    p = textbox.text_frame.add_paragraph()
+    p.text = text
+    p.font.size = Pt(size)
+    p.font.bold = True
+    p.font.name = 'Helvetica'
+    p.alignment = PP_ALIGN.LEFT
+    return textbox
+
+
+# 配置に従って画像（パスまたはバッファ）とテキストをスライドに入れる
+def fill_slide(slide, layout, pictures, texts):
+    if isinstance(layout, str):
+        layout = LAYOUTS[layout]
+    for name, (left, top, width, height) in layout['pictures'].items():
+        if name in pictures:
+            image = pictures[name]
+            if hasattr(image, 'seek'):
+                image.seek(0)  # 同じバッファを複数のスライドに入れる場合のため
+            picture = slide.shapes.add_picture(image, left, top, width=width, height=height)
+            if getattr(image, 'svg', None) is not None:
+                _attach_svg(picture, image.svg)
+    for name, (left, top, width, height, size) in layout['texts'].items():
+        if name in texts:
+            add_text(slide, left, top, width, height, texts[name], size)
+    return slide
+
+
+# 1つのテンプレートから、背景スライドを複製して患者ごと・月ごとのスライドを並べた資料を作る
+# テンプレートは最初に1回だけ解析し、保存も最後に1回だけ行う
+class DeckBuilder:
+    def __init__(self, template, output=None):
+        self.output = output
+        self.prs = load_template(template)
+        source = first_slide(self.prs)
+        # 背景スライドの中身（背景・図形）と関係を、何も入れていない状態で控えておく
+        self._layout = source.slide_layout
+        self._cSld = copy.deepcopy(source._element.cSld)
+        self._rels = [(rId, rel.reltype, rel.is_external, rel.target_ref if rel.is_external else rel.target_part)
+                      for rId, rel in source.part.rels.items() if rel.reltype not in _SKIP_RELS]
+        self._used = 0
+        self._pictures = []
+        self._seen = set()
+        self._fill_seconds = 0.0
+        self._save = None
+
+    def __len__(self):
+        return self._used
+
+    # 背景スライドを複製する（1枚目はテンプレートのスライドをそのまま使う）
+    def new_slide(self):
+        self._used += 1
+        if self._used == 1:
+            return self.prs.slides[0]
+        slide = self.prs.slides.add_slide(self._layout)
+        for shape in list(slide.placeholders):
+            shape._element.getparent().remove(shape._element)
+
+        # 画像などの関係を新しいスライドに付け替え、ID の対応をとる
+        rid_map = {}
+        for rId, reltype, is_external, target in self._rels:
+            rid_map[rId] = slide.part.relate_to(target, reltype, is_external=is_external)
+        source = copy.deepcopy(self._cSld)
+        for element in source.iter():
+            for attr in _REL_ATTRS:
+                value = element.get(attr)
+                if value in rid_map:
+                    element.set(attr, rid_map[value])
+
+        # slide.shapes は作成時の spTree を参照しているため、cSld ごと置き換えずに中身を入れ替える
+        cSld = slide._element.cSld
+        if source.bg is not None:
+            cSld.insert(0, source.bg)
+        spTree = cSld.spTree
+        for child in list(spTree):
+            spTree.remove(child)
+        for child in list(source.spTree):
+            spTree.append(child)
+        return slide
+
+    # 1枚分のレポートを追加する
+    def add_slide(self, layout, pictures, texts):
+        started = time.perf_counter()
+        slide = fill_slide(self.new_slide(), layout, pictures, texts)
+        self._fill_seconds += time.perf_counter() - started
+        # 同じ画像を複数のスライドに入れた場合（資料には1つだけ保存される）は最初の1回だけ数える
+        for image in pictures.values():
+            stats = getattr(image, 'stats', None)
+            if stats is not None and id(stats) not in self._seen:
+                self._seen.add(id(stats))
+                self._pictures.append(dict(stats, slide=self._used))
+        return slide
+
+    def save(self, output=None):
+        output = output or self.output
+        started = time.perf_counter()
+        self.prs.save(output)
+        self._save = {'output': output, 'seconds': time.perf_counter() - started, 'bytes': os.path.getsize(output)}
+        return output
+
+    # 資料ごとのサイズと処理時間（画像ごとの形式・解像度・サイズ・作成時間、スライド作成・保存の時間）
+    def report(self):
+        return {
+            'output': self._save['output'] if self._save else self.output,
+            'slides': self._used,
+            'pictures': list(self._pictures),
+            'image_bytes': sum(p['bytes'] for p in self._pictures),
+            'render_seconds': sum(p['seconds'] for p in self._pictures),
+            'fill_seconds': self._fill_seconds,
+            'save_seconds': self._save['seconds'] if self._save else None,
+            'file_bytes': self._save['bytes'] if self._save else None,
+        }
+
+
+# サイズと処理時間の表を文字列にする
+def format_report(report):
+    lines = [f"{report['output']}: {report['slides']} slide(s), {report['file_bytes'] or 0:,} bytes"]
+    for p in report['pictures']:
+        dpi = f"{p['dpi']:.0f}" if p['dpi'] else '-'
+        lines.append(f"  slide {p['slide']:3d}  {p['name']:40s} {p['format']:4s} {p['pixels'][0]:5d}x{p['pixels'][1]:<5d} "
+                     f"dpi {dpi:>4s} {p['bytes']:>11,} bytes {p['seconds']:7.3f}s")
+    save_seconds = report['save_seconds'] or 0.0
+    lines.append(f"  images {report['image_bytes']:,} bytes, render {report['render_seconds']:.3f}s, "
+                 f"slides {report['fill_seconds']:.3f}s, save {save_seconds:.3f}s")
+    return '\n'.join(lines)
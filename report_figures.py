@@ -0,0 +1,290 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from datetime import timedelta
+from glucose_overlay import BASE_DATE, draw_daily_overlay, decimate, decimate_segments
+
+# 作成済みの図のテンプレート（種類・設定・フォントサイズごとに1つ）
+# バッチ処理や常駐ワーカーでは同じ図を使い回し、患者ごとにデータだけを差し替える
+_TEMPLATES = {}
+
+
+# 図のテンプレートを取得する（無ければ作成）。フォントは作成時の rcParams が使われる
+def get_template(cls, **params):
+    key = (cls.__name__, tuple(sorted(params.items())), plt.rcParams['font.size'], plt.rcParams['font.family'][0])
+    template = _TEMPLATES.get(key)
+    if template is None:
+        template = _TEMPLATES[key] = cls(**params)
+    return template
+
+
+# 全テンプレートを閉じる
+def close_templates():
+    for template in _TEMPLATES.values():
+        template.close()
+    _TEMPLATES.clear()
+
+
+# 凡例の1列あたりの最大行数（これを超える日数は複数列に並べる）
+LEGEND_ROWS = 40
+
+# 描画前の間引き（glucose_overlay.decimate を参照）の列数
+#   列の幅は線幅（線幅より細かい変化は見えない）。軸の幅と線幅の比なので解像度によらず同じ結果になる
+#   重ね描きは全日の列数の合計を OVERLAY_COLUMN_BUDGET までにする（1日あたり MIN_DAY_COLUMNS 列 = 30分が下限）
+#   1列に残る点は 4 点以下なので、重ね描きの頂点数は日数が増えても 4 * OVERLAY_COLUMN_BUDGET 程度で頭打ちになる
+OVERLAY_COLUMN_BUDGET = 20_000
+MIN_DAY_COLUMNS = 48
+
+
+# 軸の幅を線幅で割った列数
+def _line_columns(ax, linewidth):
+    return max(1, int(ax.get_window_extent().width / (linewidth * ax.figure.dpi / 72)))
+
+
+# x軸の目盛りラベルを回転する
+def _rotate_ticks(ax, rotation=45):
+    ax.tick_params(axis='x', labelrotation=rotation)
+
+
+# 日ごとの重ね描きグラフ（{base_name}-1.png）
+class OverlayFigure:
+    def __init__(self, ylim, legend_size, figsize=(28, 12)):
+        self.legend_size = legend_size
+        self.fig, self.ax = plt.subplots(figsize=figsize, constrained_layout=True)
+        ax = self.ax
+        ax.set_xlabel("Time", fontweight='bold', fontsize=24)
+        ax.set_ylabel("Interstitial glucose level / mg/dL", fontweight='bold', fontsize=24)
+
+        # 全セグメントを1つの LineCollection で描画（影のようなエフェクト付き）
+        self.collection = draw_daily_overlay(ax, [], [], linewidth=4, stroke_width=5)
+
+        # グラフの設定
+        ax.set_xlim([mdates.date2num(BASE_DATE), mdates.date2num(BASE_DATE + timedelta(days=1))])
+        ax.set_ylim(*ylim)
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval=1))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        ax.grid(which='major', linestyle='--', linewidth=0.5)
+        _rotate_ticks(ax)
+        self.legend = None
+        self.segments = []
+        self.days = 1
+
+    # セグメントと凡例（ラベル -> 色）を差し替える。セグメントは保存時に軸の幅と日数に合わせて間引く
+    def update(self, segments, segment_colors, legend_labels):
+        self.segments = segments
+        self.days = max(1, len(legend_labels))
+        self.collection.set_segments(segments)
+        self.collection.set_color(segment_colors)
+
+        # 凡例をグラフの外に配置し、フォントサイズを調整する
+        if self.legend is not None:
+            self.legend.remove()
+        handles = [plt.Line2D([0], [0], color=color, linewidth=4) for color in legend_labels.values()]
+        self.legend = self.ax.legend(
+            handles,
+            list(legend_labels.keys()),
+            loc='upper left',
+            bbox_to_anchor=(1.06, 1),
+            prop={'size': self.legend_size},
+            ncol=max(1, -(-len(legend_labels) // LEGEND_ROWS)),
+            title='Date',
+            title_fontsize=str(self.legend_size),
+        )
+        self.legend.get_frame().set_linewidth(0.0)  # 凡例の枠線を消す
+
+    # 凡例を含むグラフを保存する（bbox_inches='tight' のため適切なパディングを指定する）
+    # tight_layout は前回の配置から再計算されるため、2回目以降は作成直後の配置に戻してから呼ぶ
+    def save(self, path, **kwargs):
+        if self.fig.get_layout_engine().adjust_compatible:
+            self.fig.subplots_adjust(**{k: plt.rcParams[f'figure.subplot.{k}'] for k in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')})
+        self.fig.tight_layout()
+        columns = min(_line_columns(self.ax, self.collection.get_linewidth()[0]),
+                      max(MIN_DAY_COLUMNS, OVERLAY_COLUMN_BUDGET // self.days))
+        self.collection.set_segments(decimate_segments(self.segments, self.ax.get_xlim(), columns))
+        self.fig.savefig(path, bbox_extra_artists=(self.legend,), bbox_inches='tight', pad_inches=0.5, transparent=True, **kwargs)
+
+    def close(self):
+        plt.close(self.fig)
+
+
+# 日ごとの重ね描きの代わりの集約グラフ（AGP: 時刻ごとの中央値と 25-75% / 5-95% の帯）
+# 日数によらず描画するものは同じ量なので、長い期間でも描画時間は変わらない。選んだ日だけ線で重ねられる
+class AgpFigure:
+    BANDS = ((5, 95, '#9ecae1', '5-95%'), (25, 75, '#4292c6', '25-75%'))
+
+    def __init__(self, ylim, legend_size, figsize=(28, 12)):
+        self.legend_size = legend_size
+        self.fig, self.ax = plt.subplots(figsize=figsize, constrained_layout=True)
+        ax = self.ax
+        ax.set_xlabel("Time", fontweight='bold', fontsize=24)
+        ax.set_ylabel("Interstitial glucose level / mg/dL", fontweight='bold', fontsize=24)
+
+        # 帯（データごとに作り直す）、中央値の線、選んだ日の線（1つの LineCollection）
+        self.bands = []
+        self.median, = ax.plot([], [], color='#08306b', linewidth=5, zorder=3)
+        self.highlights = draw_daily_overlay(ax, [], [], linewidth=3, stroke_width=4)
+        self.highlights.set_zorder(4)
+        for y in (70, 180):  # 目標範囲
+            ax.axhline(y, color='#238b45', linestyle='--', linewidth=1.5, zorder=2)
+
+        ax.set_xlim([mdates.date2num(BASE_DATE), mdates.date2num(BASE_DATE + timedelta(days=1))])
+        ax.set_ylim(*ylim)
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval=1))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        ax.grid(which='major', linestyle='--', linewidth=0.5)
+        _rotate_ticks(ax)
+        self.legend = None
+
+    # x（mdates の数値）と percentiles（5, 25, 50, 75, 95 の順の (5, N) 配列）、選んだ日の線と凡例を差し替える
+    def update(self, x, percentiles, days, segments=(), segment_colors=(), legend_labels=None):
+        for band in self.bands:
+            band.remove()
+        p5, p25, p50, p75, p95 = percentiles
+        self.bands = [self.ax.fill_between(x, low, high, color=color, linewidth=0, zorder=1)
+                      for (_, _, color, _), (low, high) in zip(self.BANDS, ((p5, p95), (p25, p75)))]
+        self.median.set_data(x, p50)
+        self.highlights.set_segments(list(segments))
+        self.highlights.set_color(list(segment_colors))
+
+        if self.legend is not None:
+            self.legend.remove()
+        handles = [plt.Line2D([0], [0], color=self.median.get_color(), linewidth=5)]
+        handles += [plt.Rectangle((0, 0), 1, 1, color=color) for _, _, color, _ in self.BANDS]
+        labels = ['Median', *(label for *_, label in self.BANDS)]
+        for label, color in (legend_labels or {}).items():
+            handles.append(plt.Line2D([0], [0], color=color, linewidth=4))
+            labels.append(label)
+        self.legend = self.ax.legend(handles, labels, loc='upper left', bbox_to_anchor=(1.06, 1),
+                                     prop={'size': self.legend_size}, title=f'{days} days',
+                                     title_fontsize=str(self.legend_size))
+        self.legend.get_frame().set_linewidth(0.0)
+
+    def save(self, path, **kwargs):
+        if self.fig.get_layout_engine().adjust_compatible:
+            self.fig.subplots_adjust(**{k: plt.rcParams[f'figure.subplot.{k}'] for k in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')})
+        self.fig.tight_layout()
+        self.fig.savefig(path, bbox_extra_artists=(self.legend,), bbox_inches='tight', pad_inches=0.5, transparent=True, **kwargs)
+
+    def close(self):
+        plt.close(self.fig)
+
+
+# 0-6時 / 6-24時の日別エラーバーと平均値線（{base_name}-2.png）
+class DayNightFigure:
+    def __init__(self, ylim, labels=('0-6 h', '6-24 h'), legend=False, figsize=(22, 9)):
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        ax = self.ax
+
+        # エラーバーと平均値線のプロット設定
+        marker_size = 12  # マーカーのサイズ
+        line_width = 2    # 線の太さ
+
+        # キャップ・縦線の artist を作っておくため、ダミーの1点で作成する
+        self.bars = [
+            ax.errorbar([0], [np.nan], yerr=[0], fmt='o-', color='blue', label=labels[0], capsize=5, markersize=marker_size, linewidth=line_width),
+            ax.errorbar([0], [np.nan], yerr=[0], fmt='o-', color='red', label=labels[1], capsize=5, markersize=marker_size, linewidth=line_width),
+        ]
+        self.avg_lines = [
+            ax.axhline(y=0, color='blue', linestyle='--', label=f'Average {labels[0]}', linewidth=line_width),
+            ax.axhline(y=0, color='lightcoral', linestyle='--', label=f'Average {labels[1]}', linewidth=line_width),
+        ]
+
+        ax.xaxis.set_major_locator(mdates.DayLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+        ax.set_ylim(*ylim)
+        ax.set_xlabel('Date', fontweight='bold', fontsize=12)
+        ax.set_ylabel('Average glucose level / mg/dL', fontweight='bold', fontsize=24)
+        _rotate_ticks(ax)
+
+        # x軸の日付が切れないように調整
+        self.fig.subplots_adjust(bottom=0.2)
+
+        # 凡例をグラフの右外に表示する場合
+        self.legend = ax.legend(loc='upper right', bbox_to_anchor=(1.21, 0.95), borderaxespad=0.) if legend else None
+        self._legend_figure = None
+
+    # 1本のエラーバーのデータを差し替える
+    @staticmethod
+    def _set_errorbar(container, x, y, err):
+        data_line, caplines, barlinecols = container.lines
+        data_line.set_data(x, y)
+        caplines[0].set_data(x, y - err)
+        caplines[1].set_data(x, y + err)
+        barlinecols[0].set_segments(np.stack([np.column_stack((x, y - err)), np.column_stack((x, y + err))], axis=1))
+
+    # 区分ごとの日別表（Date, mean, std）と期間平均を差し替える
+    def update(self, tables, averages):
+        for container, table in zip(self.bars, tables):
+            x = mdates.date2num(table['Date']) if len(table) else np.empty(0)
+            self._set_errorbar(container, x, table['mean'].to_numpy(dtype=float), table['std'].to_numpy(dtype=float))
+        for line, avg in zip(self.avg_lines, averages):
+            line.set_ydata([avg, avg])
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=True, scaley=False)
+
+    def save(self, path, **kwargs):
+        self.fig.savefig(path, transparent=True, **kwargs)
+
+    # 凡例だけの図（{base_name}-legend.png）。凡例の内容は常に同じなので1回だけ作る
+    def legend_figure(self):
+        if self._legend_figure is None:
+            fig_legend, ax_legend = plt.subplots(figsize=(3, 2))  # 凡例の図のサイズを設定（縦長に）
+            handles, labels = self.ax.get_legend_handles_labels()
+            leg = ax_legend.legend(handles, labels, loc='center', ncol=1, frameon=False)  # ncol=1 で縦一列に設定
+            for text in leg.get_texts():
+                text.set_fontsize(12)  # 凡例のテキストのフォントサイズを設定
+            ax_legend.axis('off')
+            fig_legend.tight_layout()
+            self._legend_figure = fig_legend
+        return self._legend_figure
+
+    def close(self):
+        plt.close(self.fig)
+        if self._legend_figure is not None:
+            plt.close(self._legend_figure)
+
+
+# 試合前（青）/ 試合中（赤）の区間グラフ（{base_name}-race.png）
+class RaceFigure:
+    def __init__(self, ylim=(60, 280), figsize=(18, 9)):
+        self.fig, self.ax = plt.subplots(figsize=figsize, constrained_layout=True)
+        ax = self.ax
+        ax.set_xlabel("Time", fontweight='bold', fontsize=24)
+        ax.set_ylabel("Interstitial glucose level / mg/dL", fontweight='bold', fontsize=24)
+        ax.xaxis_date()
+
+        # 曲線と実際のデータ点
+        plot_size = 50  # プロットのサイズ
+        self.blue_line, = ax.plot([], [], label='Glucose Level (Blue Interval)', color='blue', linewidth=4)
+        self.red_line, = ax.plot([], [], label='Glucose Level (Red Interval)', color='red', linewidth=4)
+        self.blue_points = ax.scatter([], [], color='blue', s=plot_size, zorder=3)
+        self.red_points = ax.scatter([], [], color='red', s=plot_size, zorder=3)
+        self.data = ((np.empty(0), np.empty(0)),) * 4
+
+        # その他の設定
+        ax.xaxis.set_major_locator(mdates.MinuteLocator(byminute=[0, 30]))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
+        _rotate_ticks(ax)
+        ax.set_ylim(*ylim)
+        ax.grid(which="major", axis="x", color="black", alpha=0.4, linestyle="--", linewidth=0.8)
+        ax.grid(which="major", axis="y", color="black", alpha=0.4, linestyle="--", linewidth=0.8)
+
+    # 曲線・データ点（x は mdates の数値）と表示範囲を差し替える。データは保存時に軸の幅に合わせて間引く
+    def update(self, blue_curve, red_curve, blue_points, red_points, xlim):
+        self.data = (blue_curve, red_curve, blue_points, red_points)
+        self.ax.set_xlim([mdates.date2num(xlim[0]), mdates.date2num(xlim[1])])
+
+    # 最大値・最小値の点は間引いても残るので、試合中の最大値などの見た目は変わらない
+    def save(self, path, **kwargs):
+        self.fig.get_layout_engine().execute(self.fig)
+        columns = _line_columns(self.ax, self.blue_line.get_linewidth())
+        x_range = self.ax.get_xlim()
+        blue_curve, red_curve, blue_points, red_points = (decimate(x, y, x_range, columns) for x, y in self.data)
+        self.blue_line.set_data(*blue_curve)
+        self.red_line.set_data(*red_curve)
+        self.blue_points.set_offsets(np.column_stack(blue_points))
+        self.red_points.set_offsets(np.column_stack(red_points))
+        self.fig.savefig(path, transparent=True, **kwargs)
+
+    def close(self):
+        plt.close(self.fig)
@@ -0,0 +1,148 @@
+import io
+import os
+import time
+
+# グラフ画像の出力設定（レポート関数の image_options で上書きする）
+#   in_memory      : True ならグラフを PNG としてメモリ上に書き出し、ディスクを経由せずスライドに挿入する
+#   debug_png      : in_memory のときも中間 PNG をファイルに書き出す（確認用）
+#   dpi            : 保存時の解像度（None なら図の既定値）
+#   compress_level : PNG の圧縮レベル 0-9（None なら既定値）
+#   slide_ppi      : スライド上の大きさに対する解像度（例: 150）。指定すると dpi をスライド上の幅から決める
+#   quantize       : True なら PNG を256色のパレット画像にする（透明度は保つ）
+#   optimize       : True なら PNG の圧縮を最適化する（画質は変わらない）
+#   vector         : 'svg' ならベクター画像（SVG）で挿入する（SVG 非対応のソフト用に低解像度の PNG も入れる）
+IMAGE_OPTIONS = {
+    'in_memory': False,
+    'debug_png': False,
+    'dpi': None,
+    'compress_level': None,
+    'slide_ppi': None,
+    'quantize': False,
+    'optimize': False,
+    'vector': None,
+}
+
+# 対応しているベクター形式（EMF は matplotlib で書き出せないため対象外）
+VECTOR_FORMATS = ('svg',)
+
+# SVG と一緒に入れる代替 PNG のスライド上の解像度
+FALLBACK_PPI = 72
+
+_EMU_PER_INCH = 914400
+
+
+# 既定値に指定された設定を重ねる
+def image_options(options=None):
+    merged = dict(IMAGE_OPTIONS)
+    if options:
+        unknown = set(options) - set(IMAGE_OPTIONS)
+        if unknown:
+            raise ValueError(f'Unknown image options: {sorted(unknown)}')
+        merged.update(options)
+    if merged['vector'] is not None and merged['vector'] not in VECTOR_FORMATS:
+        raise ValueError(f"Unsupported vector format: {merged['vector']!r} (supported: {', '.join(VECTOR_FORMATS)})")
+    return merged
+
+
+# メモリ上のグラフ画像。stats に形式・解像度・サイズ・作成時間を持つ（svg はベクター画像の内容）
+class RenderedImage(io.BytesIO):
+    stats = None
+    svg = None
+
+
+# ファイルに書き出したグラフ画像のパス（RenderedImage と同じ属性を持つ）
+class RenderedPath(str):
+    stats = None
+    svg = None
+
+
+# スライド上の大きさ（EMU の (width, height)、どちらかは None でもよい）と図の大きさから dpi を求める
+def slide_dpi(fig, slide_size, ppi):
+    if not ppi or fig is None or not slide_size:
+        return None
+    width, height = slide_size
+    fig_width, fig_height = fig.get_size_inches()
+    if width:
+        return ppi * width / _EMU_PER_INCH / fig_width
+    if height:
+        return ppi * height / _EMU_PER_INCH / fig_height
+    return None
+
+
+# PNG を256色のパレット画像に変換する（透明な背景は透明のまま）
+def quantize_png(data, pil_kwargs=None):
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        quantized = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    out = io.BytesIO()
+    quantized.save(out, format='png', **(pil_kwargs or {}))
+    return out.getvalue()
+
+
+def _pixel_size(image):
+    from PIL import Image
+    with Image.open(image) as opened:
+        size = opened.size
+    if hasattr(image, 'seek'):
+        image.seek(0)
+    return size
+
+
+# グラフを保存し、add_picture に渡せるもの（ファイルパスまたはメモリ上のバッファ）を返す
+# save は savefig と同じ引数をとる関数（図のテンプレートの save など）
+# fig と slide_size（スライド上の大きさ）を渡すと、slide_ppi の指定から dpi を決める
+def render_figure(save, path, options, fig=None, slide_size=None):
+    started = time.perf_counter()
+    kwargs = {}
+    dpi = slide_dpi(fig, slide_size, options['slide_ppi']) or options['dpi']
+    if dpi:
+        kwargs['dpi'] = dpi
+    pil_kwargs = {}
+    if options['compress_level'] is not None:
+        pil_kwargs['compress_level'] = options['compress_level']
+    if options['optimize']:
+        pil_kwargs['optimize'] = True
+
+    write_file = not options['in_memory'] or options['debug_png']
+    if write_file:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    # ベクター画像の場合、PNG はスライド上で低解像度の代替画像にする
+    svg = None
+    if options['vector'] == 'svg':
+        buffer = io.BytesIO()
+        save(buffer, format='svg', **kwargs)
+        svg = buffer.getvalue()
+        if write_file:
+            with open(f'{os.path.splitext(path)[0]}.svg', 'wb') as fp:
+                fp.write(svg)
+        kwargs['dpi'] = slide_dpi(fig, slide_size, FALLBACK_PPI) or FALLBACK_PPI
+    if pil_kwargs and not options['quantize']:
+        kwargs['pil_kwargs'] = pil_kwargs
+
+    if not options['in_memory'] and not options['quantize']:
+        save(path, **kwargs)
+        image = RenderedPath(path)
+        size = os.path.getsize(path)
+    else:
+        buffer = io.BytesIO()
+        save(buffer, format='png', **kwargs)
+        data = buffer.getvalue()
+        if options['quantize']:
+            data = quantize_png(data, pil_kwargs)
+        if write_file:
+            with open(path, 'wb') as fp:
+                fp.write(data)
+        image = RenderedImage(data) if options['in_memory'] else RenderedPath(path)
+        size = len(data)
+
+    image.svg = svg
+    image.stats = {
+        'name': os.path.basename(path),
+        'format': 'svg' if svg is not None else 'png',
+        'dpi': kwargs.get('dpi'),
+        'pixels': _pixel_size(image),
+        'bytes': size + (len(svg) if svg is not None else 0),
+        'seconds': time.perf_counter() - started,
+    }
+    return image
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# 環境変数による既定の設定
+#   GLUCOSE_METRICS_LOG     : 1回の実行ごとに1行の JSON を追記するファイル
+#   GLUCOSE_METRICS_SUMMARY : 1 なら実行ごとに段階別の表を標準エラーに表示する
+#   GLUCOSE_METRICS_MEMORY  : 1 なら tracemalloc で段階ごとのピークメモリも測る（処理は遅くなる）
+LOG_ENV = 'GLUCOSE_METRICS_LOG'
+SUMMARY_ENV = 'GLUCOSE_METRICS_SUMMARY'
+MEMORY_ENV = 'GLUCOSE_METRICS_MEMORY'
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# 1回のレポート作成の段階ごとの計測（経過時間・CPU時間・ピークメモリ・件数）
+# 時間の計測は常に行っても負担にならない。メモリは memory=True のときだけ測る
+class RunMetrics:
+    def __init__(self, log=None, summary=None, memory=None):
+        self.log = log if log is not None else os.environ.get(LOG_ENV)
+        self.summary = summary if summary is not None else _env_flag(SUMMARY_ENV)
+        self.memory = memory if memory is not None else _env_flag(MEMORY_ENV)
+        self.stages = []
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.timestamp = datetime.now().isoformat(timespec='seconds')
+        self._own_tracing = False
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+
+    # 1つの段階を計測する。with の中で返された dict に件数（rows, segments など）を入れる
+    @contextmanager
+    def stage(self, name, **counts):
+        if self.memory:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counts
+        finally:
+            entry = {'stage': name, 'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu}
+            if self.memory:
+                entry['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+            entry.update(counts)
+            self.stages.append(entry)
+
+    # 計測結果（JSON にできる dict）
+    def record(self, **info):
+        return {
+            'timestamp': self.timestamp,
+            **info,
+            'wall': time.perf_counter() - self.started,
+            'cpu': time.process_time() - self.started_cpu,
+            'stages': list(self.stages),
+        }
+
+    # 計測を終え、設定に応じてログへの追記・表の表示を行う
+    def finish(self, **info):
+        record = self.record(**info)
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+        if self.log:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log)), exist_ok=True)
+            with open(self.log, 'a', encoding='utf-8') as fp:
+                fp.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        if self.summary:
+            print(format_summary(record), file=sys.stderr)
+        return record
+
+
+# 段階別の表を文字列にする
+def format_summary(record):
+    title = ' '.join(str(record[key]) for key in ('report', 'csv_file') if record.get(key))
+    lines = [f"{title}: {record['wall']:.3f}s (cpu {record['cpu']:.3f}s)"]
+    for s in record['stages']:
+        share = s['wall'] / record['wall'] * 100 if record['wall'] else 0.0
+        memory = f"  peak {s['peak_bytes'] / 2 ** 20:7.2f} MiB" if 'peak_bytes' in s else ''
+        counts = ', '.join(f'{k}={v}' for k, v in s.items() if k not in ('stage', 'wall', 'cpu', 'peak_bytes'))
+        lines.append(f"  {s['stage']:22s} {s['wall']:8.3f}s {share:5.1f}%  cpu {s['cpu']:8.3f}s{memory}  {counts}")
+    if record.get('cache'):
+        lines.append('  result cache: ' + ', '.join(f'{k}={v}' for k, v in record['cache'].items()))
+    return '\n'.join(lines)
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+# 監視デーモンでは画面表示をしない
+import matplotlib
+matplotlib.use('Agg')
+
+from glucose_reports import REPORTS
+from report_batch import run_job
+from report_worker import warm_up
+
+# 既定の設定
+#   SETTLE   : ファイルの大きさ・更新時刻がこの秒数変わらなければ書き込み完了とみなす（書き込み途中のファイルを読まない）
+#   INTERVAL : フォルダを調べる間隔（秒）
+#   POOL_RETRIES : ワーカープロセスの異常終了（BrokenProcessPool）で失敗したジョブを、プールを作り直して再実行する回数
+SETTLE = 2.0
+INTERVAL = 0.5
+POOL_RETRIES = 2
+STATUS_LOG_NAME = 'watch_status.jsonl'
+
+# 試合レポートのイベントファイル（エクスポートと同じ名前 + この拡張子。例: 240103_kishimoto.events.csv）
+EVENTS_SUFFIX = '.events.csv'
+
+
+# 監視フォルダ内のエクスポート CSV とレポートの種類を列挙する
+# in_dir 直下の CSV は既定の種類、種類名のサブフォルダ（monthly / glucose / race）内の CSV はその種類のレポートにする
+# イベントファイルと . や ~$ で始まる一時ファイルはエクスポートとして扱わない
+def list_exports(in_dir, report):
+    found = []
+    for folder, kind in [(in_dir, report)] + [(os.path.join(in_dir, r), r) for r in sorted(REPORTS)]:
+        try:
+            entries = list(os.scandir(folder))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in sorted(entries, key=lambda e: e.name):
+            name = entry.name.lower()
+            if (entry.is_file() and name.endswith('.csv') and not name.endswith(EVENTS_SUFFIX)
+                    and not entry.name.startswith(('.', '~$'))):
+                found.append((entry.path, kind))
+    return found
+
+
+def events_path(csv_file):
+    return os.path.splitext(csv_file)[0] + EVENTS_SUFFIX
+
+
+# ファイルの状態（大きさ・更新時刻。試合レポートはイベントファイルの状態も含む）。ファイルが無い場合は None
+def _signature(csv_file, report):
+    try:
+        st = os.stat(csv_file)
+    except FileNotFoundError:
+        return None
+    signature = (st.st_size, st.st_mtime_ns)
+    if report == 'race':
+        try:
+            ev = os.stat(events_path(csv_file))
+            signature += (ev.st_size, ev.st_mtime_ns)
+        except FileNotFoundError:
+            signature += (None, None)
+    return signature
+
+
+# 状態ログ（1行1イベントの JSON）から、前回までに処理したファイルの状態を読み込む（再起動時に同じファイルを処理し直さない）
+def load_status(path):
+    done = {}
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('event') in ('done', 'failed') and record.get('signature'):
+                    done[record['csv_file']] = tuple(record['signature'])
+    return done
+
+
+# 入力フォルダを監視し、新しい・変更されたエクスポートのレポートを作成する
+# ファイルは状態が settle 秒変わらなくなってからキューに入れ、workers 個のプロセスで並列に処理する
+# 処理中に変わったファイルは、処理が終わった後にもう一度処理する
+class FolderWatcher:
+    def __init__(self, in_dir, out_dir='reports', template_dir='.', report='glucose', workers=2,
+                 settle=SETTLE, interval=INTERVAL, status_log=None, job_defaults=None):
+        if report not in REPORTS:
+            raise ValueError(f'Unknown report type: {report!r}')
+        self.in_dir = in_dir
+        self.out_dir = out_dir
+        self.template_dir = template_dir
+        self.report = report
+        self.workers = workers
+        self.settle = settle
+        self.interval = interval
+        self.status_log = status_log if status_log is not None else os.path.join(out_dir, STATUS_LOG_NAME)
+        self.job_defaults = dict(job_defaults or {})
+        self.observed = {}   # csv_file -> (状態, その状態を最初に見た時刻)
+        self.done = load_status(self.status_log)   # csv_file -> 処理した状態
+        self.queued = {}     # csv_file -> キューに入れた（または処理中の）状態
+        self.waiting = set()  # イベントファイルを待っている試合のエクスポート
+        self.queue = asyncio.Queue()
+        self.counts = {'done': 0, 'failed': 0}
+        self.pool = None
+        self.retries = {}    # csv_file -> プールの異常で再実行した回数
+
+    # 状態ログに1行追記し、標準エラーにも表示する
+    def _status(self, event, job, **info):
+        record = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'event': event,
+                  'csv_file': job['csv_file'], 'report': job['report'], **info}
+        os.makedirs(os.path.dirname(os.path.abspath(self.status_log)), exist_ok=True)
+        with open(self.status_log, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        detail = info.get('output') or info.get('error') or ''
+        seconds = f"{info['seconds']:7.2f}s" if 'seconds' in info else ' ' * 8
+        print(f"{event:8s} {job['report']:8s} {os.path.basename(job['csv_file']):40s} {seconds}  {detail}",
+              file=sys.stderr, flush=True)
+
+    def _job(self, csv_file, report):
+        job = dict(self.job_defaults, csv_file=csv_file, report=report)
+        if report == 'race':
+            job['events'] = events_path(csv_file)
+        return job
+
+    # フォルダを1回調べ、書き込みが終わった新しい・変更されたファイルをキューに入れる
+    # 戻り値: まだ書き込み中（状態が落ち着いていない）のファイルの数
+    def scan(self, now=None):
+        now = time.monotonic() if now is None else now
+        unsettled = 0
+        exports = list_exports(self.in_dir, self.report)
+        present = {path for path, _ in exports}
+        for path in list(self.observed):
+            if path not in present:
+                del self.observed[path]
+        for path, report in exports:
+            signature = _signature(path, report)
+            if signature is None:
+                continue
+            seen = self.observed.get(path)
+            if seen is None or seen[0] != signature:
+                self.observed[path] = (signature, now)
+                unsettled += 1
+                continue
+            if now - seen[1] < self.settle:
+                unsettled += 1
+                continue
+            if signature[0] == 0 or self.done.get(path) == signature or path in self.queued:
+                continue
+            job = self._job(path, report)
+            if report == 'race' and signature[2] is None:
+                if path not in self.waiting:
+                    self.waiting.add(path)
+                    self._status('waiting', job, error=f'no events file {os.path.basename(job["events"])}')
+                continue
+            self.waiting.discard(path)
+            self.queued[path] = signature
+            self.queue.put_nowait((job, signature, seen[1]))
+            self._status('queued', job)
+        return unsettled
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up, initargs=(self.template_dir,))
+
+    # 壊れたプールを作り直す（同じプールで失敗した別のワーカーが作り直し済みなら何もしない）
+    def _restart_pool(self, broken):
+        if self.pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = self._new_pool()
+
+    # キューからジョブを取り出してプロセスプールで実行する（workers 個並べて同時実行数を制限する）
+    # ワーカープロセスが異常終了した場合はプールを作り直し、ジョブをキューに戻す（処理済みにはしない）
+    # POOL_RETRIES 回を超えた場合と、それ以外の例外は失敗として記録し、次のジョブに進む
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, signature, detected = await self.queue.get()
+            csv_file = job['csv_file']
+            requeue = False
+            try:
+                self._status('started', job)
+                pool = self.pool
+                try:
+                    result = await loop.run_in_executor(pool, run_job, job, self.out_dir, self.template_dir)
+                except BrokenProcessPool as e:
+                    self._restart_pool(pool)
+                    self.retries[csv_file] = self.retries.get(csv_file, 0) + 1
+                    if self.retries[csv_file] > POOL_RETRIES:
+                        raise
+                    requeue = True
+                    self._status('requeued', job, error=f'{type(e).__name__}: {e}')
+                    continue
+                info = {'seconds': result['seconds'], 'latency': time.monotonic() - detected, 'signature': signature}
+                if result['ok']:
+                    self.counts['done'] += 1
+                    self._status('done', job, output=result['output'], **info)
+                else:
+                    self.counts['failed'] += 1
+                    self._status('failed', job, error=result['error'], **info)
+                    print(result['traceback'], file=sys.stderr, flush=True)
+                self.done[csv_file] = signature
+            except Exception as e:
+                self.counts['failed'] += 1
+                self._status('failed', job, error=f'{type(e).__name__}: {e}',
+                             latency=time.monotonic() - detected, signature=signature)
+                print(traceback.format_exc(), file=sys.stderr, flush=True)
+                self.done[csv_file] = signature
+            finally:
+                if requeue:
+                    self.queue.put_nowait((job, signature, detected))
+                else:
+                    self.retries.pop(csv_file, None)
+                    del self.queued[csv_file]
+                self.queue.task_done()
+
+    # 監視を続ける。stop（asyncio.Event）がセットされたら、キューに残ったジョブを処理してから終わる
+    # once=True の場合は、フォルダ内のファイルをすべて処理した時点で終わる（テスト・手動実行用）
+    async def run(self, stop=None, once=False):
+        stop = stop or asyncio.Event()
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.pool = self._new_pool()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            while not stop.is_set():
+                unsettled = self.scan()
+                if once and not unsettled and not self.queued:
+                    break
+                try:
+                    await asyncio.wait_for(stop.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.pool.shutdown()
+        return dict(self.counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Watch a folder of CGM exports and generate reports as files arrive')
+    parser.add_argument('in_dir', help='folder to watch; CSVs in monthly/, glucose/ or race/ subfolders use that report type')
+    parser.add_argument('--report', choices=sorted(REPORTS), default='glucose', help='report type for CSVs directly in in_dir')
+    parser.add_argument('--out-dir', default='reports')
+    parser.add_argument('--template-dir', default='.')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='worker processes (reports generated at the same time)')
+    parser.add_argument('--settle', type=float, default=SETTLE, help='seconds a file must stay unchanged before it is read')
+    parser.add_argument('--interval', type=float, default=INTERVAL, help='seconds between folder scans')
+    parser.add_argument('--status-log', help=f'JSON-lines status log (default: OUT_DIR/{STATUS_LOG_NAME})')
+    parser.add_argument('--once', action='store_true', help='process the files present now, then exit')
+    parser.add_argument('--compact', action='store_true', help='load readings as compact int64-seconds/float32 series')
+    parser.add_argument('--cgm-metrics', action='store_true', help='add TIR/CV/GMI/MAGE to the report text boxes')
+    args = parser.parse_args(argv)
+
+    job_defaults = {key: True for key in ('compact', 'cgm_metrics') if getattr(args, key)}
+    watcher = FolderWatcher(args.in_dir, args.out_dir, args.template_dir, args.report, args.jobs,
+                            args.settle, args.interval, args.status_log, job_defaults)
+
+    async def watch():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, AttributeError):
+                pass  # Windows では Ctrl+C（KeyboardInterrupt）で終わる
+        print(f'watching {args.in_dir} ({args.jobs} workers, settle {args.settle}s)', file=sys.stderr, flush=True)
+        return await watcher.run(stop, once=args.once)
+
+    counts = asyncio.run(watch())
+    print(f"{counts['done']} report(s) written, {counts['failed']} failed", file=sys.stderr)
+    return 0 if not counts['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+
+# 常駐ワーカーでは画面表示をしない
+import matplotlib
+matplotlib.use('Agg')
+
+from matplotlib import font_manager
+from glucose_reports import FONT_RC
+from report_deck import load_template
+from report_batch import TEMPLATES, run_job
+
+# 既定の待ち受けアドレス（ローカルのみ）
+HOST = '127.0.0.1'
+PORT = 8765
+
+
+# 重いモジュール・フォント・テンプレートを最初に一度だけ読み込んでおく
+def warm_up(template_dir='.'):
+    started = time.perf_counter()
+    import scipy.interpolate  # noqa: F401  平滑化を指定したジョブ用
+    font_manager.findfont(font_manager.FontProperties(family=FONT_RC['font.family'], weight=FONT_RC['font.weight']))
+    for template in TEMPLATES.values():
+        path = os.path.join(template_dir, template)
+        if os.path.exists(path):
+            load_template(path)
+    return time.perf_counter() - started
+
+
+# 1件のジョブを実行し、結果（成否・処理時間）を JSON で返せる形にする
+def handle_job(job, out_dir, template_dir):
+    job = dict(job)
+    return run_job(job, job.pop('out_dir', out_dir), template_dir)
+
+
+def _log(result, file=sys.stderr):
+    name = os.path.basename(result['job'].get('csv_file', '?'))
+    status = 'OK  ' if result['ok'] else 'FAIL'
+    detail = result['output'] if result['ok'] else result['error']
+    print(f"{status} {result['job'].get('report', '?'):8s} {name:40s} {result['seconds']:7.3f}s  {detail}", file=file, flush=True)
+
+
+# ソケットから1行1ジョブ（JSON）を受け取り、1行1結果（JSON）を返す
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                reply = {'job': {}, 'ok': False, 'seconds': 0.0, 'error': f'invalid job: {e}'}
+            else:
+                reply = handle_job(job, self.server.out_dir, self.server.template_dir)
+                _log(reply)
+            self.wfile.write((json.dumps(reply, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+# matplotlib はスレッドセーフではないため、ジョブは1件ずつ順番に処理する
+class ReportServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address, out_dir='reports', template_dir='.'):
+        super().__init__(address, _JobHandler)
+        self.out_dir = out_dir
+        self.template_dir = template_dir
+
+
+# ジョブファイル（1行1ジョブの JSON Lines）をこのプロセス内で順に処理する
+def run_job_file(path, out_dir='reports', template_dir='.'):
+    results = []
+    with open(path, encoding='utf-8') as fp:
+        for line in fp:
+            if line.strip():
+                result = handle_job(json.loads(line), out_dir, template_dir)
+                _log(result)
+                results.append(result)
+    return results
+
+
+# 実行中のワーカーにジョブを送り、結果を受け取る
+def submit(jobs, host=HOST, port=PORT):
+    results = []
+    with socket.create_connection((host, port)) as sock, sock.makefile('rwb') as stream:
+        for job in jobs:
+            stream.write((json.dumps(job, ensure_ascii=False) + '\n').encode('utf-8'))
+            stream.flush()
+            results.append(json.loads(stream.readline()))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resident glucose report worker')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_serve = sub.add_parser('serve', help='accept JSON-lines jobs on a local TCP socket')
+    p_serve.add_argument('--host', default=HOST)
+    p_serve.add_argument('--port', type=int, default=PORT)
+    p_file = sub.add_parser('run', help='process a JSON-lines job file in one warm process')
+    p_file.add_argument('job_file')
+    for p in (p_serve, p_file):
+        p.add_argument('--out-dir', default='reports')
+        p.add_argument('--template-dir', default='.')
+    p_submit = sub.add_parser('submit', help='send a JSON-lines job file to a running worker')
+    p_submit.add_argument('job_file')
+    p_submit.add_argument('--host', default=HOST)
+    p_submit.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    if args.command == 'submit':
+        with open(args.job_file, encoding='utf-8') as fp:
+            jobs = [json.loads(line) for line in fp if line.strip()]
+        results = submit(jobs, args.host, args.port)
+        for result in results:
+            _log(result, file=sys.stdout)
+        return 0 if all(r['ok'] for r in results) else 1
+
+    print(f'warm-up {warm_up(args.template_dir):.2f}s', file=sys.stderr)
+    if args.command == 'run':
+        results = run_job_file(args.job_file, args.out_dir, args.template_dir)
+        return 0 if all(r['ok'] for r in results) else 1
+
+    with ReportServer((args.host, args.port), args.out_dir, args.template_dir) as server:
+        print(f'listening on {args.host}:{args.port}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
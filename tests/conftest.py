@@ -0,0 +1,8 @@
+import os
+import sys
+
+# スクリプトと同じくリポジトリ直下のモジュールを import する。グラフは画面に表示しない
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from glucose_archive import open_archive, import_csv
+from glucose_io import GlucoseSeries, time_range
+from glucose_synth import synth_glucose
+
+
+def _sorted(series):
+    order = np.lexsort((series['glucose'], series['time']))
+    return series['time'][order], series['glucose'][order]
+
+
+# 新しいエクスポートの後に古い（重なる）エクスポートを取り込んでも、和集合を時刻順に持つ
+def test_backfill_keeps_the_union_in_time_order(tmp_path):
+    readings = synth_glucose(30, start='2023-01-01')
+    recent, older = tmp_path / '230115_tester.csv', tmp_path / '230101_tester.csv'
+    readings[readings['time'] >= '2023-01-15'].to_csv(recent, index=False)
+    readings[readings['time'] < '2023-01-20'].to_csv(older, index=False)
+    archive_dir = str(tmp_path / 'archive')
+
+    _, added_recent, _ = import_csv(str(recent), archive_dir)
+    _, added_older, total = import_csv(str(older), archive_dir)
+    _, added_again, _ = import_csv(str(older), archive_dir)
+    assert added_again == 0
+
+    full = GlucoseSeries.from_frame(readings.drop_duplicates(['time', 'glucose']).sort_values('time', kind='stable'))
+    assert total == len(full) == added_recent + added_older
+    archive = open_archive('tester', archive_dir)
+    assert archive.index['generation'] == 1
+    assert (np.diff(archive.seconds) >= 0).all()
+    assert len(archive.dates) == 30
+    for start, end in [(None, None), ('2023-01-10', '2023-01-20'), ('2023-01-14 22:00', '2023-01-15 02:00')]:
+        expected = full if start is None else time_range(full, start, end)
+        for actual, wanted in zip(_sorted(archive.series(start, end)), _sorted(expected)):
+            np.testing.assert_array_equal(actual, wanted)
+
+
+# 最後の時刻以降だけの取り込みは、同じ世代の列に追記する
+def test_append_stays_in_the_same_generation(tmp_path):
+    readings = synth_glucose(4, start='2023-01-01', duplicate_rate=0)
+    first, second = tmp_path / '230101_tester.csv', tmp_path / '230103_tester.csv'
+    readings[readings['time'] < '2023-01-03'].to_csv(first, index=False)
+    readings[readings['time'] >= pd.Timestamp('2023-01-02 12:00')].to_csv(second, index=False)
+    archive_dir = str(tmp_path / 'archive')
+    import_csv(str(first), archive_dir)
+    import_csv(str(second), archive_dir)
+    archive = open_archive('tester', archive_dir)
+    assert archive.index['generation'] == 0
+    assert len(archive) == len(readings)
@@ -0,0 +1,51 @@
+import os
+import pytest
+from pptx import Presentation
+from glucose_archive import import_csv
+from glucose_io import load_glucose_csv, range_bounds
+from glucose_synth import synth_glucose, write_synth_csv
+from report_batch import TEMPLATES, main, split_months
+
+
+# 月ごとの期間が、元の期間の測定値をちょうど1回ずつ含む（境界で抜けも重なりもない）
+@pytest.mark.parametrize('start_date, end_date', [
+    (None, None),
+    ('2023-01-15', '2023-03-10'),
+    ('2023-01-15 12:30', '2023-03-31 23:59:59'),
+])
+def test_split_months_covers_each_reading_once(tmp_path, start_date, end_date):
+    csv_file = tmp_path / '230101_tester.csv'
+    write_synth_csv(csv_file, 90, cadence=1, start='2023-01-01')
+    job = {'csv_file': str(csv_file), 'report': 'monthly'}
+    if start_date:
+        job.update(start_date=start_date, end_date=end_date)
+    parts = split_months([dict(job)])
+    assert len(parts) == 3
+
+    df = load_glucose_csv(str(csv_file), cache=False)
+    total = range_bounds(df, parts[0]['start_date'], parts[-1]['end_date'])
+    if start_date:
+        assert total == range_bounds(df, start_date, end_date)
+    else:
+        assert total == (0, len(df))
+    rows = [range_bounds(df, part['start_date'], part['end_date']) for part in parts]
+    assert rows[0][0] == total[0] and rows[-1][1] == total[1]
+    assert all(a[1] == b[0] for a, b in zip(rows, rows[1:]))
+
+
+# --per-month --archive では、月の分け方もアーカイブ全体の期間から決める（CSV は最新の月だけ）
+def test_per_month_uses_the_archive_range(tmp_path):
+    df = synth_glucose(90, start='2023-01-01')
+    exports = tmp_path / 'exports'
+    exports.mkdir()
+    df.to_csv(exports / '230101_tester.csv', index=False)
+    import_csv(str(exports / '230101_tester.csv'), str(tmp_path / 'archive'))
+    df[df['time'] >= '2023-03-01'].to_csv(exports / '230101_tester.csv', index=False)
+    for name in set(TEMPLATES.values()):
+        Presentation().save(tmp_path / name)
+
+    out_dir = tmp_path / 'out'
+    assert main([str(exports), '--report', 'monthly', '--per-month', '--archive', str(tmp_path / 'archive'),
+                 '--out-dir', str(out_dir), '--template-dir', str(tmp_path), '-j', '1']) == 0
+    assert sorted(name for name in os.listdir(out_dir) if name.endswith('.pptx')) == [
+        f'230101_tester-{month}-monthly.pptx' for month in ('2023-01', '2023-02', '2023-03')]
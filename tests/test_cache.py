@@ -0,0 +1,62 @@
+import os
+import pytest
+from pptx import Presentation
+from glucose_reports import monthly_report, _result_cache
+from glucose_synth import write_synth_csv
+from report_cache import RESULT_CACHE_ENV, ResultCache, evict
+
+
+@pytest.fixture
+def export(tmp_path):
+    csv_file = tmp_path / '230101_tester.csv'
+    write_synth_csv(csv_file, 10)
+    template = tmp_path / 'template.pptx'
+    Presentation().save(template)
+    return csv_file, template
+
+
+def test_result_cache_argument(tmp_path, monkeypatch):
+    monkeypatch.setenv(RESULT_CACHE_ENV, str(tmp_path / 'env'))
+    assert _result_cache(False) is None
+    assert _result_cache(None).directory == str(tmp_path / 'env')
+    assert _result_cache(str(tmp_path / 'dir')).directory == str(tmp_path / 'dir')
+    cache = ResultCache(tmp_path / 'own')
+    assert _result_cache(cache) is cache
+    for wrong in (True, 1, {}):
+        with pytest.raises(TypeError):
+            _result_cache(wrong)
+
+
+def test_cache_false_bypasses_env_cache(export, tmp_path, monkeypatch):
+    csv_file, template = export
+    monkeypatch.setenv(RESULT_CACHE_ENV, str(tmp_path / 'env'))
+    result = monthly_report(str(csv_file), '2023-01-02', '2023-01-08', template=str(template),
+                            output=str(tmp_path / 'out.pptx'), out_dir=str(tmp_path / 'out'), cache=False)
+    assert os.path.exists(result['output'])
+    assert 'cache' not in result['metrics']
+    assert not os.path.exists(tmp_path / 'env')
+
+
+# 同じデータ・設定の2回目は、グラフも表もキャッシュから取り出す
+def test_second_run_hits_the_cache(export, tmp_path):
+    csv_file, template = export
+    runs = []
+    for i in range(2):
+        runs.append(monthly_report(str(csv_file), '2023-01-02', '2023-01-08', template=str(template),
+                                   output=str(tmp_path / f'out{i}.pptx'), out_dir=str(tmp_path / f'out{i}'),
+                                   cache=str(tmp_path / 'cache')))
+    first, second = (run['metrics']['cache'] for run in runs)
+    assert first['hits'] == 0 and first['stores'] > 0
+    assert second == {'hits': first['stores'], 'misses': 0, 'stores': 0, 'evicted': 0}
+
+
+# 上限を超えたら、最後に使ったのが古いものから削除する
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10 ** 9)
+    for i, key in enumerate('abc'):
+        cache.put(key, b'x' * 1000)
+        os.utime(tmp_path / f'{key}.pkl', ns=(i * 10 ** 9, i * 10 ** 9))
+    assert cache.get('a') is not None   # 使うと更新時刻が新しくなる
+    removed = evict(str(tmp_path), 2500)
+    assert removed == ['b.pkl']
+    assert cache.get('b') is None and cache.get('c') is not None
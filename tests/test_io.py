@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from glucose_io import GlucoseSeries, load_glucose_csv, time_range
+from glucose_stats import bucket_stats
+from glucose_synth import write_synth_csv
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / '230101_tester.csv'
+    write_synth_csv(path, 10, duplicate_rate=0.01)
+    return str(path)
+
+
+# compact=True（GlucoseSeries）と DataFrame の読み込みは同じ測定値・同じ統計になる
+def test_compact_loader_matches_frame(export):
+    df = load_glucose_csv(export, cache=False)
+    series = load_glucose_csv(export, cache=False, compact=True)
+    assert isinstance(series, GlucoseSeries)
+    np.testing.assert_array_equal(series['time'].astype('datetime64[ns]'), df['time'].to_numpy())
+    np.testing.assert_array_equal(series['glucose'], df['glucose'].to_numpy(dtype=np.float32))
+
+    for start_date, end_date in [('2023-01-02', '2023-01-05'), ('2023-01-03 07:30', '2023-01-09 23:59')]:
+        part_series, part_df = time_range(series, start_date, end_date), time_range(df, start_date, end_date)
+        assert len(part_series) == len(part_df)
+        daily, period = bucket_stats(part_series)
+        daily_expected, period_expected = bucket_stats(part_df)
+        assert daily['count'].tolist() == daily_expected['count'].tolist()
+        np.testing.assert_allclose(period.to_numpy(float), period_expected.to_numpy(float), rtol=1e-6)
+
+
+# 解析済みのキャッシュは同じ内容を返し、元ファイルが変われば読み込み直す
+def test_parse_cache_follows_the_source(export, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = load_glucose_csv(export, cache_dir=cache_dir)
+    assert list((tmp_path / 'cache').iterdir())
+    cached = load_glucose_csv(export, cache_dir=cache_dir)
+    assert cached.equals(first)
+
+    write_synth_csv(export, 3, seed=1)
+    reloaded = load_glucose_csv(export, cache_dir=cache_dir)
+    assert reloaded.equals(load_glucose_csv(export, cache=False))
+    assert len(reloaded) != len(first)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from glucose_overlay import decimate_indices, decimate_segments, smooth_segment, split_daily_segments
+from glucose_synth import synth_glucose
+from report_figures import OverlayFigure, OVERLAY_COLUMN_BUDGET, MIN_DAY_COLUMNS
+
+
+# 知らない平滑化の種類は、点が足りず平滑化しないデータでもエラーにする
+def test_unknown_smooth_mode_is_rejected():
+    times = np.array(['2023-01-01T00:00', '2023-01-01T06:00'], dtype='datetime64[ns]')
+    with pytest.raises(ValueError, match='cubik'):
+        split_daily_segments(times, [100.0, 110.0], smooth='cubik')
+    with pytest.raises(ValueError, match='cubik'):
+        split_daily_segments([], [], smooth='cubik')
+    with pytest.raises(ValueError, match='cubik'):
+        smooth_segment([0.0], [100.0], smooth='cubik')
+    for mode in ('linear', 'cubic', 'monotone'):
+        x, y = smooth_segment(np.arange(5.0), np.arange(5.0) ** 2, smooth=mode, points=50)
+        assert len(x) == len(y) == 50
+
+
+def test_decimate_keeps_ends_and_extremes():
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.random(10_000))
+    y = rng.normal(size=10_000)
+    idx = decimate_indices(x, y, (0, 1), 100)
+    assert len(idx) <= 4 * 100
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert y[idx].max() == y.max() and y[idx].min() == y.min()
+
+
+def test_decimate_segments_is_per_segment():
+    rng = np.random.default_rng(1)
+    segments = [np.column_stack((np.linspace(0, 1, 1440), rng.normal(size=1440))) for _ in range(20)]
+    result = decimate_segments(segments, (0, 1), 64)
+    assert len(result) == len(segments)
+    for seg, dec in zip(segments, result):
+        assert len(dec) <= 4 * 64
+        assert dec[0].tolist() == seg[0].tolist() and dec[-1].tolist() == seg[-1].tolist()
+        assert dec[:, 1].max() == seg[:, 1].max() and dec[:, 1].min() == seg[:, 1].min()
+
+
+def test_decimate_leaves_sparse_data_unchanged():
+    segments = [np.column_stack((np.linspace(0, 1, 288), np.arange(288.0)))]
+    assert decimate_segments(segments, (0, 1), 400)[0] is segments[0]
+
+
+def test_overlay_vertices_are_bounded_for_long_ranges(tmp_path):
+    df = synth_glucose(180, cadence=1)
+    segments, days = split_daily_segments(df['time'], df['glucose'])
+    labels = {str(day): '#000000' for day in sorted(set(days))}
+    figure = OverlayFigure((40, 300), 10)
+    try:
+        figure.update(segments, ['#000000'] * len(segments), labels)
+        figure.save(tmp_path / 'overlay.png', dpi=20)
+        drawn = sum(len(path.vertices) for path in figure.collection.get_paths())
+    finally:
+        figure.close()
+    assert drawn < sum(len(s) for s in segments)
+    assert drawn <= 4 * max(OVERLAY_COLUMN_BUDGET, MIN_DAY_COLUMNS * len(labels)) + 2 * len(segments)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from glucose_io import load_glucose_csv, time_range
+from glucose_stats import bucket_stats, stream_bucket_stats
+from glucose_synth import synth_glucose
+
+
+# 重複行（他の列だけが違う行を含む）と時刻の無い行のある、時刻順のエクスポート
+@pytest.fixture
+def export(tmp_path):
+    df = synth_glucose(20, cadence=5, duplicate_rate=0.01)
+    df['device'] = 'A'
+    dup = df.sample(100, random_state=1).assign(device='B')
+    df = pd.concat([df, dup]).sort_values('time', kind='stable')
+    blank = df.iloc[[10, 500, 3000]].assign(time=pd.NaT)
+    df = pd.concat([df.iloc[:3000], blank, df.iloc[3000:]])
+    path = tmp_path / '230101_tester.csv'
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize('chunksize', [97, 1000, 200_000])
+@pytest.mark.parametrize('start_date, end_date', [('2023-01-05', '2023-01-15'), ('2023-01-01', '2023-01-20 12:00')])
+def test_stream_matches_in_memory(export, chunksize, start_date, end_date):
+    daily, period = stream_bucket_stats(export, start_date, end_date, chunksize=chunksize)
+    daily_expected, period_expected = bucket_stats(time_range(load_glucose_csv(export, cache=False), start_date, end_date))
+    assert daily['count'].tolist() == daily_expected['count'].tolist()
+    np.testing.assert_allclose(daily['mean'], daily_expected['mean'], rtol=1e-9)
+    np.testing.assert_allclose(period.to_numpy(float), period_expected.to_numpy(float), rtol=1e-9)
+
+
+def test_stream_rejects_unsorted_exports(tmp_path):
+    df = synth_glucose(3)
+    path = tmp_path / '230101_tester.csv'
+    pd.concat([df.iloc[500:], df.iloc[:500]]).to_csv(path, index=False)
+    with pytest.raises(ValueError, match='time order'):
+        stream_bucket_stats(str(path), '2023-01-01', '2023-01-04', chunksize=100)
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from glucose_io import load_glucose_csv, time_range
+from glucose_stats import bucket_stats
+from glucose_store import update_from_csv, load_store, store_path, store_stats
+from glucose_synth import synth_glucose
+
+RANGES = [
+    ('2023-01-05', '2023-02-20'),                    # 終了は日付だけ（最終日は 0時の測定値だけ）
+    ('2023-01-05 13:00', '2023-02-20 23:59:59'),
+    ('2023-02-20 03:00', '2023-02-20 04:00'),
+    ('2023-01-01', '2023-04-30'),
+]
+
+
+def assert_same_stats(actual, expected):
+    (daily, period), (daily_expected, period_expected) = actual, expected
+    assert daily['count'].tolist() == daily_expected['count'].tolist()
+    assert list(daily['Date']) == list(daily_expected['Date'])
+    for col in ('mean', 'std', 'min', 'max'):
+        np.testing.assert_allclose(daily[col], daily_expected[col], rtol=1e-9)
+    np.testing.assert_allclose(period.to_numpy(float), period_expected.to_numpy(float), rtol=1e-9)
+
+
+@pytest.fixture
+def readings():
+    return synth_glucose(60, cadence=5, start='2023-01-01')
+
+
+def _export(tmp_path, name, df):
+    path = tmp_path / f'{name}_tester.csv'
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+# 日の途中で重なる2つのエクスポートを取り込んでも、全体を読み込んで集計した結果と同じになる
+@pytest.mark.parametrize('start_date, end_date', RANGES)
+def test_overlapping_exports_match_full_recompute(tmp_path, readings, start_date, end_date):
+    store_dir = str(tmp_path / 'store')
+    update_from_csv(_export(tmp_path, 'a', readings[readings['time'] < '2023-02-20 12:00']), store_dir)
+    _, store, changed = update_from_csv(_export(tmp_path, 'b', readings[readings['time'] >= '2023-02-20 06:00']), store_dir)
+    assert changed[0] == pd.Timestamp('2023-02-20').date()
+
+    full = load_glucose_csv(_export(tmp_path, 'full', readings), cache=False)
+    expected = bucket_stats(time_range(full, start_date, end_date))
+    assert_same_stats(store_stats(store, start_date, end_date), expected)
+    assert_same_stats(store_stats(load_store(store_path('tester', store_dir)), start_date, end_date), expected)
+
+
+# 値を修正した再エクスポートは保存済みの値を置き換える（二重に数えない）。変わっていない日は再集計しない
+def test_corrected_reexport_replaces_values(tmp_path, readings):
+    store_dir = str(tmp_path / 'store')
+    update_from_csv(_export(tmp_path, 'a', readings), store_dir)
+    assert update_from_csv(_export(tmp_path, 'a', readings), store_dir)[2] == []
+
+    corrected = readings.copy()
+    fix = corrected['time'].between('2023-01-10 08:00', '2023-01-10 09:00')
+    corrected.loc[fix, 'glucose'] += 20
+    _, store, changed = update_from_csv(_export(tmp_path, 'b', corrected[corrected['time'] >= '2023-01-08']), store_dir)
+    assert changed == [pd.Timestamp('2023-01-10').date()]
+
+    full = load_glucose_csv(_export(tmp_path, 'full', corrected), cache=False)
+    for start_date, end_date in RANGES:
+        assert_same_stats(store_stats(store, start_date, end_date), bucket_stats(time_range(full, start_date, end_date)))
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from glucose_overlay import TIME_THRESHOLD
+from glucose_synth import synth_glucose
+
+
+# 合成データは実際のエクスポートと同じ形で、間隔・欠測・重複を含み、seed が同じなら同じ内容になる
+@pytest.mark.parametrize('cadence', [1, 5, 15])
+def test_synth_glucose_has_cadence_gaps_and_duplicates(cadence):
+    df = synth_glucose(28, cadence=cadence, gaps_per_week=3, duplicate_rate=0.01)
+    assert list(df.columns) == ['time', 'glucose']
+    steps = np.diff(df['time'].to_numpy())
+    assert (steps >= np.timedelta64(0)).all()
+    assert np.median(steps) == np.timedelta64(cadence, 'm')
+    assert (steps > np.timedelta64(TIME_THRESHOLD)).any()
+    assert df['time'].duplicated().any()
+    assert df['glucose'].between(40, 400).all()
+    assert df.equals(synth_glucose(28, cadence=cadence, gaps_per_week=3, duplicate_rate=0.01))
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import pytest
+from pptx import Presentation
+import report_watch
+from report_batch import TEMPLATES, run_job
+from report_watch import FolderWatcher
+from glucose_synth import write_synth_csv
+
+
+@pytest.fixture
+def folders(tmp_path):
+    in_dir, out_dir, template_dir = tmp_path / 'in', tmp_path / 'out', tmp_path / 'templates'
+    in_dir.mkdir()
+    template_dir.mkdir()
+    for name in set(TEMPLATES.values()):
+        Presentation().save(template_dir / name)
+    return in_dir, out_dir, template_dir
+
+
+def _watch(in_dir, out_dir, template_dir):
+    watcher = FolderWatcher(str(in_dir), str(out_dir), str(template_dir), workers=1, settle=0, interval=0.05)
+    return asyncio.run(watcher.run(once=True))
+
+
+def _events(out_dir):
+    with open(os.path.join(out_dir, report_watch.STATUS_LOG_NAME), encoding='utf-8') as fp:
+        return [(os.path.basename(r['csv_file']), r['event']) for r in map(json.loads, fp)]
+
+
+# 1回目の実行で落ちる（ワーカープロセスの異常終了）。2回目からは通常どおり実行する
+def _crash_once(job, out_dir, template_dir):
+    marker = os.path.join(out_dir, '.crashed')
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return run_job(job, out_dir, template_dir)
+
+
+def test_watch_once_records_done_and_failed(folders):
+    in_dir, out_dir, template_dir = folders
+    write_synth_csv(in_dir / '230101_tester.csv', 7)
+    (in_dir / '230101_broken.csv').write_text('time,value\n2023-01-01 00:00:00,100\n')
+
+    assert _watch(in_dir, out_dir, template_dir) == {'done': 1, 'failed': 1}
+    events = _events(out_dir)
+    assert ('230101_tester.csv', 'done') in events
+    assert ('230101_broken.csv', 'failed') in events
+    assert any(name.endswith('.pptx') for name in os.listdir(out_dir))
+
+    # 状態ログから処理済みのファイルを読み込むので、変わっていないファイルは処理し直さない
+    assert _watch(in_dir, out_dir, template_dir) == {'done': 0, 'failed': 0}
+
+
+def test_watch_restarts_a_broken_pool_and_retries(folders, monkeypatch):
+    in_dir, out_dir, template_dir = folders
+    write_synth_csv(in_dir / '230101_tester.csv', 3)
+    monkeypatch.setattr(report_watch, 'run_job', _crash_once)
+
+    assert _watch(in_dir, out_dir, template_dir) == {'done': 1, 'failed': 0}
+    assert [event for _, event in _events(out_dir)] == ['queued', 'started', 'requeued', 'started', 'done']
+
+
+def _crash(job, out_dir, template_dir):
+    os._exit(1)
+
+
+def test_watch_gives_up_after_pool_retries(folders, monkeypatch):
+    in_dir, out_dir, template_dir = folders
+    write_synth_csv(in_dir / '230101_tester.csv', 1)
+    monkeypatch.setattr(report_watch, 'run_job', _crash)
+
+    assert _watch(in_dir, out_dir, template_dir) == {'done': 0, 'failed': 1}
+    events = [event for _, event in _events(out_dir)]
+    assert events.count('started') == report_watch.POOL_RETRIES + 1
+    assert events[-1] == 'failed'